@@ -1,74 +1,111 @@
+from collections import deque
 from sdl2 import *
-from grid import Collision
-from gameclock import GameClock
+from frametimer import percentile
+from session import Action
+
+KEY_ACTIONS = {
+  SDL_SCANCODE_LEFT: Action.LEFT,
+  SDL_SCANCODE_RIGHT: Action.RIGHT,
+  SDL_SCANCODE_DOWN: Action.DOWN,
+  SDL_SCANCODE_UP: Action.ROTATE,
+}
+
+class InputQueue:
+  '''
+  Collects key presses through an SDL event watch. SDL calls the watch when
+  an event is pushed, which for the keyboard happens in SDL_PumpEvents, so
+  presses are still only collected when the loop polls, and their SDL
+  timestamps are the pump time. A press may have happened any time after
+  the previous pump, so it's stamped with that time instead, the worst case
+  of its wait for the poll. Polling at the simulation rate, not the watch,
+  keeps that wait short. Key repeats from the OS are left out,
+  ActionHandler repeats held keys. The presses Bot pushes with
+  SDL_PushEvent have no window, they're collected without a timestamp so
+  they aren't counted as key latency.
+  '''
+  def __init__(self):
+    self.events = deque()
+    self.last_pump = SDL_GetTicks()
+    self.previous_pump = self.last_pump
+    # kept referenced while SDL holds it
+    self.watch = SDL_EventFilter(self.on_event)
+    SDL_AddEventWatch(self.watch, None)
+
+  def close(self):
+    SDL_DelEventWatch(self.watch, None)
+
+  def pump(self):
+    '''
+    Pumps the OS events into SDL. Call it right before polling the events.
+    '''
+    self.previous_pump = self.last_pump
+    self.last_pump = SDL_GetTicks()
+    SDL_PumpEvents()
+
+  def on_event(self, userdata, event):
+    event = event.contents
+    if event.type in (SDL_KEYDOWN, SDL_KEYUP) and not event.key.repeat:
+      timestamp = self.previous_pump if event.key.windowID else None
+      self.events.append((timestamp, event.type, event.key.keysym.scancode))
+    return 0
+
+  def pop_events(self):
+    '''
+    Returns the collected (timestamp, type, scancode) in the order they were
+    pushed, timestamp being None for the bot's presses.
+    '''
+    events = []
+    while self.events:
+      events.append(self.events.popleft())
+
+    return events
 
 class ActionHandler:
-  def __init__(self, grid, clock, actions_per_second):
-    self.grid = grid
-    self.clock = GameClock(clock, actions_per_second)
-    self.move_left = False
-    self.moved_left = True
-    self.move_right = False
-    self.moved_right = True
-    self.rotate = False
-    self.rotated = True
-    self.accelerate = False
-    self.accelerated = True
-  
-  def start(self):
-    self.clock.start()
-  
-  def handle_keypress_event(self, event):
-    if event.type == SDL_KEYDOWN:
-      if event.key.keysym.scancode == SDL_SCANCODE_LEFT:
-        self.move_left = True
-        self.moved_left = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_RIGHT:
-        self.move_right = True
-        self.moved_right = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_DOWN:
-        self.accelerate = True
-        self.accelerated = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_UP:
-        self.rotate = True
-        self.rotated = False
+  '''
+  Applies a key press to the session as soon as it's handled, then repeats
+  it actions_per_second times a second while the key is held. Keeps the
+  latency from the last presses' timestamps to their effect.
+  '''
+  def __init__(self, session, clock, actions_per_second, window=1000):
+    self.session = session
+    self.clock = clock
+    self.repeat_time = 1000000000 // actions_per_second
+    # clock time of the next repeat of every held key's action
+    self.next_repeats = {}
+    self.latencies = deque(maxlen=window)
+
+  def handle_key(self, timestamp, event_type, scancode):
+    action = KEY_ACTIONS.get(scancode)
+    if action is None:
+      return
+
+    if event_type == SDL_KEYDOWN:
+      self.session.step(action)
+      if timestamp is not None:
+        self.latencies.append(SDL_GetTicks() - timestamp)
+      self.next_repeats[action] = self.clock.time + self.repeat_time
+    else:
+      self.next_repeats.pop(action, None)
 
-    elif event.type == SDL_KEYUP:
-      if event.key.keysym.scancode == SDL_SCANCODE_LEFT:
-        self.move_left = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_RIGHT:
-        self.move_right = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_DOWN:
-        self.accelerate = False
-      elif event.key.keysym.scancode == SDL_SCANCODE_UP:
-        self.rotate = False
-  
   def execute_actions(self):
-    for _ in range(self.clock.get_ticks()):
-      if self.move_left or not self.moved_left:
-        self.moved_left = True
-        try:
-          self.grid.move_piece(-1, 0)
-        except Collision:
-          self.grid.move_piece(1, 0)
-      
-      if self.move_right or not self.moved_right:
-        self.moved_right = True
-        try:
-          self.grid.move_piece(1, 0)
-        except Collision:
-          self.grid.move_piece(-1, 0)
-      
-      if self.accelerate or not self.accelerated:
-        self.accelerated = True
-        try:
-          self.grid.move_piece(0, 1)
-        except Collision:
-          self.grid.move_piece(0, -1)
-      
-      if self.rotate or not self.rotated:
-        self.rotated = True
-        try:
-          self.grid.rotate_piece()
-        except Collision:
-          self.grid.rotate_piece_backwards()
\ No newline at end of file
+    now = self.clock.time
+    for action, next_repeat in self.next_repeats.items():
+      while next_repeat <= now:
+        self.session.step(action)
+        next_repeat += self.repeat_time
+      self.next_repeats[action] = next_repeat
+
+  def latency_report(self):
+    if not self.latencies:
+      return 'key latency: no key pressed'
+
+    latencies = sorted(self.latencies)
+    return (
+      'key latency (ms, last {} presses): p50 {} p95 {} p99 {} max {}'
+    ).format(
+      len(latencies),
+      percentile(latencies, 0.5),
+      percentile(latencies, 0.95),
+      percentile(latencies, 0.99),
+      latencies[-1]
+    )
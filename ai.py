@@ -1,9 +1,13 @@
-import ctypes
+import argparse
+import os
 import random
-from sdl2 import *
+import time
+from multiprocessing import Pool
 from grid import Grid, Collision
-from pieces import pieces
-from settings import *
+from bitgrid import BitGrid
+from placements import placements, is_spawn_area_clear, SPAWN_Y
+from session import GameSession
+from replay import ReplayRecorder
 
 A = 0.103831
 B = 0.164168
@@ -12,12 +16,10 @@ D = 0.962466
 E = 0.206230
 
 class PossibleFit:
-  def __init__(self, fitness, x, rot, grid):
+  def __init__(self, fitness, x, rot):
     self.fitness = fitness
     self.x = x
     self.rot = rot
-    self.grid = grid
-    self.hole_count = grid.holes
 
   def __lt__(self, other):
     return self.fitness < other.fitness
@@ -32,38 +34,58 @@ class AI:
     self.e = e
   
   def run(self):
-    # possible positions with their fitnesses
+    # each candidate is placed on self.grid, scored and undone
     best_fitness = -10000000000.0
-    for rot in self.grid.piece.unique_rotations:
+    grid = self.grid
+    piece = grid.piece
+    for rot, x, y in self.candidates():
+      if y is not None:
+        fitness, _ = self.evaluate(piece, rot, x, y)
+      else:
+        fitness = -10000000000.0
+      
+      if fitness > best_fitness:
+        best_fitness = fitness
+        self.best_fit = PossibleFit(fitness, x, rot)
+
+  def evaluate(self, piece, rot, x, y, cleared_rows=0):
+    '''
+    Places piece on the grid, scores the result and undoes the placement.
+    Returns the fitness and how many rows the placement cleared, rows
+    cleared by earlier placements can be counted in with cleared_rows.
+    '''
+    grid = self.grid
+    filled_rows, record = grid.place(piece, rot, x, y)
+    fitness = self.compute_fitness(grid, cleared_rows + filled_rows)
+    grid.undo(record)
+
+    return fitness, filled_rows
+
+  def candidates(self):
+    '''
+    Yields (rot, x, y) for every drop of the grid's piece, y being the row
+    it lands at or None when it can't be placed in column x.
+    '''
+    grid = self.grid
+    piece = grid.piece
+    piece_placements = placements[piece.color]
+    use_table = grid.piece_pos[1] == SPAWN_Y and is_spawn_area_clear(grid)
+    for rot in piece.unique_rotations:
   
-      original_rot = self.grid.piece.rot
-      self.grid.piece.rot = rot
-      min_x, max_x = self.find_min_max_x(self.grid)
+      original_rot = piece.rot
+      piece.rot = rot
+      placement = piece_placements[rot]
+      if use_table:
+        min_x, max_x = placement.min_max_x(grid.w)
+      else:
+        min_x, max_x = self.find_min_max_x(grid)
       for x in range(min_x, max_x + 1):
-        working_grid = self.grid.copy()
-
-        working_grid.piece_pos = [x, 1]
-        game_over = False
-        try:
-          while True:
-            working_grid.move_piece(0, 1)
-        except Collision:
-          try:
-            working_grid.move_piece(0, -1)
-          except Collision:
-            game_over = True
-      
-        if not game_over:
-          filled_rows = working_grid.integrate_piece()
-          fitness = self.compute_fitness(working_grid, filled_rows)
+        if use_table:
+          yield rot, x, placement.landing_y(grid.heights, x, grid.h)
         else:
-          fitness = -10000000000.0
-        
-        if fitness > best_fitness:
-          best_fitness = fitness
-          self.best_fit = PossibleFit(fitness, x, rot, working_grid)
+          yield rot, x, self.find_landing_y(grid, x)
 
-      self.grid.piece.rot = original_rot    
+      piece.rot = original_rot    
  
   def compute_fitness(self, grid, filled_rows):
     fitness = (
@@ -100,32 +122,26 @@ class AI:
     
     return min_x, max_x
 
+  @staticmethod
+  def find_landing_y(grid, x):
+    '''
+    Drops the piece from the spawn row in column x, returns the row it rests at or
+    None if it can't be placed there. Leaves grid.piece_pos unchanged.
+    '''
+    original_pos = grid.piece_pos
+    grid.piece_pos = [x, SPAWN_Y]
+    try:
+      while True:
+        grid.move_piece(0, 1)
+    except Collision:
+      try:
+        grid.move_piece(0, -1)
+        y = grid.piece_pos[1]
+      except Collision:
+        y = None
 
-class Bot(AI):  
-  def adjust_position(self):
-    moved = False
-    x = self.grid.piece_pos[0]
-    if x < self.best_fit.x:
-      self.send_keypress(SDL_SCANCODE_RIGHT)
-      moved = True
-    elif x > self.best_fit.x:
-      self.send_keypress(SDL_SCANCODE_LEFT)
-      moved = True
-    
-    if self.grid.piece.rot != self.best_fit.rot:
-      self.send_keypress(SDL_SCANCODE_UP)
-      moved = True
-
-    if not moved:
-      self.send_keypress(SDL_SCANCODE_DOWN)
-  
-  def send_keypress(self, scancode):
-    new_event = SDL_Event()
-    new_event.type = SDL_KEYDOWN
-    new_event.key.keysym.scancode = scancode
-    SDL_PushEvent(ctypes.byref(new_event))
-    new_event.type = SDL_KEYUP
-    SDL_PushEvent(ctypes.byref(new_event))
+    grid.piece_pos = original_pos
+    return y
 
 
 class VirtualBot(AI):
@@ -133,54 +149,151 @@ class VirtualBot(AI):
     self.grid.piece.rot = self.best_fit.rot
     self.grid.piece_pos[0] = self.best_fit.x
 
-def simulate_game(count, a=A, b=B, c=C, d=D, e=E, print_stats=True, stop=False):
-  scores = []
-  for _ in range(count):
-    score = 0
-    grid = Grid(None, MAP_SIZE[0], MAP_SIZE[1], CELL_SIZE)
-    grid.add_piece(random.choice(pieces), 4, 1)
-    bot = VirtualBot(grid, a, b, c, d)
-    bot.run()
-
-    while True:
-      bot.adjust_position()
-      try:
-        while True:
-          grid.move_piece(0, 1)
-      except Collision:
-        try:
-          grid.move_piece(0, -1)
-          score += grid.integrate_piece()
-          new_piece = random.choice(pieces)
-          new_piece.reset_rotation()
-          grid.add_piece(new_piece, 4, 1)
-          bot.run()
-
-          if stop and score >= 800:
-            scores.append(score)
-            break
-
-        except Collision:
-          scores.append(score)
-          break      
-    
-  scores.sort()
+def game_seeds(count, seed=None):
+  '''
+  Returns one seed per game, derived from seed or drawn from random when
+  seed is None.
+  '''
+  rng = random if seed is None else random.Random(seed)
+  return [rng.getrandbits(64) for _ in range(count)]
+
+def play_game(
+  seed, a=A, b=B, c=C, d=D, e=E, stop=False, grid_class=Grid,
+  bot_class=VirtualBot, preview=0, record_path=None
+):
+  '''
+  Plays one game with pieces drawn from random.Random(seed), returns the
+  number of cleared rows. The next preview pieces are shown to the bot in
+  bot.preview. With record_path, the game is recorded there as a replay.
+  '''
+  return play_session(
+    seed, a, b, c, d, e, stop, grid_class, bot_class, preview, record_path
+  ).score
+
+def play_session(
+  seed, a=A, b=B, c=C, d=D, e=E, stop=False, grid_class=Grid,
+  bot_class=VirtualBot, preview=0, record_path=None
+):
+  '''
+  Plays one game as play_game does and returns its GameSession, which
+  also tells how many pieces were played.
+  '''
+  recorder = ReplayRecorder(record_path, seed) if record_path else None
+  session = GameSession(grid_class, seed, preview, recorder)
+  bot = bot_class(session.grid, a, b, c, d, e)
+  while not session.game_over:
+    bot.preview = session.preview
+    try:
+      bot.run()
+    except Collision:
+      # a rotation collides at the spawn, that's game over
+      break
+
+    bot.adjust_position()
+    session.hard_drop()
+    if stop and session.score >= 800:
+      break
+
+  if recorder:
+    recorder.close(session)
+
+  return session
+
+def score_stats(scores):
+  '''
+  Returns the median, average, min and max of scores.
+  '''
+  scores = sorted(scores)
   min_score = scores[0]
   max_score = scores[-1]
   total_score = sum(scores)
   avg_score = total_score / len(scores)
   median_score = (scores[(len(scores) - 1)//2] + scores[len(scores)//2]) / 2
+  return median_score, avg_score, min_score, max_score
+
+def print_score_stats(scores):
+  median_score, avg_score, min_score, max_score = score_stats(scores)
+  print('-' * 40)
+  print('median     :', median_score)
+  print('avg score  :', avg_score)
+  print('min score  :', min_score)
+  print('max score  :', max_score)
+  print('-' * 40)
+  print(sorted(scores))
+
+def replay_path(record_dir, seed):
+  if record_dir is None:
+    return None
+
+  return os.path.join(record_dir, '{}.replay'.format(seed))
+
+def simulate_game(
+  count, a=A, b=B, c=C, d=D, e=E, print_stats=True, stop=False,
+  grid_class=Grid, bot_class=VirtualBot, seed=None, preview=0, workers=1,
+  record_dir=None
+):
+  '''
+  Plays count games and returns the median score.
+  With workers > 1 the games are spread over a process pool. Every game's
+  pieces come from its own seed, so the scores only depend on seed, not on
+  the number of workers.
+  With record_dir, every game is recorded there as <game seed>.replay.
+  '''
+  seeds = game_seeds(count, seed)
+  games = [
+    (
+      game_seed, a, b, c, d, e, stop, grid_class, bot_class, preview,
+      replay_path(record_dir, game_seed)
+    )
+    for game_seed in seeds
+  ]
+  if workers > 1:
+    with Pool(workers) as pool:
+      scores = pool.starmap(play_game, games, chunksize=1)
+  else:
+    scores = [play_game(*game) for game in games]
 
   if print_stats:
-    print('-' * 40)
-    print('median     :', median_score)
-    print('avg score  :', avg_score)
-    print('min score  :', min_score)
-    print('max score  :', max_score)
-    print('-' * 40)
-    print(sorted(scores))
+    print_score_stats(scores)
+
+  return score_stats(scores)[0]
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Plays games with the AI and prints the score stats.'
+  )
+  parser.add_argument('--games', type=int, default=100)
+  parser.add_argument(
+    '--workers', type=int, default=1, help='processes playing the games'
+  )
+  parser.add_argument(
+    '--seed', type=int,
+    help='master seed, the same seed gives the same scores for any --workers'
+  )
+  parser.add_argument(
+    '--weights', type=float, nargs=5, default=(A, B, C, D, E),
+    metavar=('A', 'B', 'C', 'D', 'E')
+  )
+  parser.add_argument(
+    '--stop', action='store_true', help='end games at 800 cleared rows'
+  )
+  parser.add_argument(
+    '--bitboard', action='store_true', help='use the BitGrid engine'
+  )
+  parser.add_argument(
+    '--record', metavar='DIR', help='record every game to DIR/<seed>.replay'
+  )
+  args = parser.parse_args()
+  if args.record:
+    os.makedirs(args.record, exist_ok=True)
 
-  return median_score
+  t0 = time.perf_counter()
+  simulate_game(
+    args.games, *args.weights, stop=args.stop,
+    grid_class=BitGrid if args.bitboard else Grid, seed=args.seed,
+    workers=args.workers, record_dir=args.record
+  )
+  print('{:.2f} s'.format(time.perf_counter() - t0))
 
 if __name__ == '__main__':
-  simulate_game(100)
\ No newline at end of file
+  main()
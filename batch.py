@@ -0,0 +1,118 @@
+'''
+Scores candidate placements as stacked NumPy boards instead of one at a
+time. The boards are boolean arrays of the grid's interior (walls left
+out), filled cells being True. Any number of leading dimensions is
+accepted, so the boards of many games can be scored in one call.
+Needs NumPy: `pip3 install numpy`.
+'''
+
+import numpy as np
+from ai import AI, VirtualBot, PossibleFit
+from colors import Color
+from placements import placements
+
+def grid_to_board(grid):
+  return np.array(
+    [[cell != Color.BLACK for cell in row[1:-1]] for row in grid.cells[1:-1]],
+    dtype=bool
+  )
+
+def clear_rows(boards):
+  '''
+  Takes boards shaped (count, rows, cols), returns them with their full rows
+  removed and the rows above moved down, and how many rows each cleared.
+  '''
+  full = boards.all(axis=2)
+  cleared = full.sum(axis=1)
+  clearing = np.flatnonzero(cleared)
+  if len(clearing):
+    # stable sort moves the full rows to the top keeping the others' order
+    order = np.argsort(~full[clearing], axis=1, kind='stable')
+    cleared_boards = np.take_along_axis(
+      boards[clearing], order[:, :, None], axis=1
+    )
+    cleared_boards &= (
+      np.arange(boards.shape[1]) >= cleared[clearing, None]
+    )[:, :, None]
+    boards = boards.copy()
+    boards[clearing] = cleared_boards
+
+  return boards, cleared
+
+def board_stats(boards):
+  '''
+  Clears the full rows of boards and returns arrays with, for each board,
+  the cleared row count, holes, aggregate height, bumpiness and wells depth,
+  computed the same way as Grid.compute_stats.
+  '''
+  shape = boards.shape[:-2]
+  rows, cols = boards.shape[-2:]
+  boards = boards.reshape(-1, rows, cols)
+
+  boards, cleared = clear_rows(boards)
+  filled_columns = boards.any(axis=1)
+  heights = np.where(filled_columns, rows - boards.argmax(axis=1), 0)
+  covered = np.logical_or.accumulate(boards, axis=1)
+  holes = (covered & ~boards).sum(axis=(1, 2))
+  aggregate_height = heights.sum(axis=1)
+  bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+  walls = np.full((len(heights), 1), rows)
+  padded = np.concatenate((walls, heights, walls), axis=1)
+  dh = np.minimum(padded[:, :-2], padded[:, 2:]) - heights
+  wells_depth = np.where(dh >= 3, dh, 0).sum(axis=1)
+
+  return tuple(
+    stat.reshape(shape)
+    for stat in (cleared, holes, aggregate_height, bumpiness, wells_depth)
+  )
+
+def score_boards(boards, a, b, c, d, e):
+  '''
+  Returns the fitness of each board, as AI.compute_fitness would. The
+  weights can be arrays broadcastable to the boards' leading dimensions,
+  for instance one weight per game.
+  '''
+  cleared, holes, aggregate_height, bumpiness, wells_depth = board_stats(
+    boards
+  )
+  return (
+    cleared * a
+    - bumpiness * b
+    - aggregate_height * c
+    - holes * d
+    - wells_depth * e
+  )
+
+class BatchAI(AI):
+  '''
+  AI that builds one board per candidate placement and scores all of them
+  with score_boards. Picks the same placement as AI.run.
+  '''
+  def run(self):
+    grid = self.grid
+    piece_placements = placements[grid.piece.color]
+    candidates = [
+      (rot, x, y) for rot, x, y in self.candidates() if y is not None
+    ]
+    if not candidates:
+      return
+
+    # interior coordinates of every candidate's cells
+    cell_rows = []
+    cell_cols = []
+    for rot, x, y in candidates:
+      for dx, dy in piece_placements[rot].cells:
+        cell_rows.append(y + dy - 1)
+        cell_cols.append(x + dx - 1)
+
+    boards = np.repeat(grid_to_board(grid)[None], len(candidates), axis=0)
+    boards[np.repeat(np.arange(len(candidates)), 4), cell_rows, cell_cols] = True
+
+    fitnesses = score_boards(boards, self.a, self.b, self.c, self.d, self.e)
+    best = int(fitnesses.argmax())
+    rot, x, _ = candidates[best]
+    self.best_fit = PossibleFit(float(fitnesses[best]), x, rot)
+
+class VirtualBatchBot(BatchAI, VirtualBot):
+  pass
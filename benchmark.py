@@ -0,0 +1,461 @@
+'''
+Benchmarks for the engine and AI hot paths.
+Run `python3 benchmark.py [engine] [placements] [games] [imports] [lookahead]
+[render]`, by default all of them. Add `--json` for machine-readable results and
+`--compare old.json` to print the ratio to an earlier run. Seeds and fixtures
+are fixed, so runs are comparable. Works with CPython and PyPy, tracemalloc
+and NumPy are used when available. render and the import of the SDL layer
+need PySDL2 and are reported as skipped without it, render uses the dummy
+video driver unless SDL_VIDEODRIVER is set.
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from ai import AI, VirtualBot, simulate_game
+from grid import Grid, Collision
+from bitgrid import BitGrid
+from lookahead import BeamSearchAI
+from pieces import pieces
+from placements import placements, is_spawn_area_clear, SPAWN_Y
+from session import SPAWN_X
+from settings import *
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+try:
+  from batch import BatchAI
+except ImportError:
+  BatchAI = None
+
+def result(name, value, unit):
+  return {'name': name, 'value': value, 'unit': unit}
+
+def skipped(name, reason):
+  return {'name': name, 'value': None, 'unit': None, 'skipped': reason}
+
+def sdl_missing():
+  '''
+  Returns why PySDL2 can't be used, None when it can. PySDL2 raises
+  RuntimeError when it's installed but the SDL2 library isn't.
+  '''
+  try:
+    import sdl2
+  except (ImportError, RuntimeError) as error:
+    return str(error)
+
+  return None
+
+def time_op(op, make_args, repeat=5):
+  '''
+  Calls op on every argument of make_args() and returns the mean time per
+  call in nanoseconds, the best of repeat runs. make_args isn't timed.
+  '''
+  best = None
+  for _ in range(repeat):
+    args = make_args()
+    t0 = time.perf_counter()
+    for arg in args:
+      op(arg)
+    dt = (time.perf_counter() - t0) / len(args)
+    if best is None or dt < best:
+      best = dt
+
+  return best * 1e9
+
+def make_fixtures(count, grid_class, seed=0):
+  '''
+  Plays games with the default AI and returns count grids taken at piece
+  spawns, each one holding its freshly spawned piece. Spawns with blocks
+  in the spawn rows are skipped so every fixture uses the lookup tables.
+  '''
+  rng = random.Random(seed)
+  fixtures = []
+  while len(fixtures) < count:
+    grid = grid_class(MAP_SIZE[0], MAP_SIZE[1])
+    bot = VirtualBot(grid)
+    try:
+      while len(fixtures) < count:
+        grid.add_piece(rng.choice(pieces).spawn(), SPAWN_X, SPAWN_Y)
+        if is_spawn_area_clear(grid):
+          fixtures.append(grid.copy())
+        bot.run()
+        bot.adjust_position()
+        y = bot.find_landing_y(grid, grid.piece_pos[0])
+        grid.piece_pos[1] = y
+        grid.integrate_piece()
+    except Collision:
+      pass
+
+  return fixtures
+
+def copy_evaluation(ai):
+  '''
+  Evaluates every placement on a grid copy, the way AI.run used to.
+  '''
+  grid = ai.grid
+  best = None
+  for rot in grid.piece.unique_rotations:
+    placement = placements[grid.piece.color][rot]
+    min_x, max_x = placement.min_max_x(grid.w)
+    for x in range(min_x, max_x + 1):
+      working_grid = grid.copy()
+      working_grid.piece.rot = rot
+      working_grid.piece_pos = [x, placement.landing_y(grid.heights, x, grid.h)]
+      filled_rows = working_grid.integrate_piece()
+      fitness = ai.compute_fitness(working_grid, filled_rows)
+      if best is None or fitness > best[0]:
+        best = fitness, working_grid
+
+def count_placements(grid):
+  count = 0
+  for rot in grid.piece.unique_rotations:
+    min_x, max_x = placements[grid.piece.color][rot].min_max_x(grid.w)
+    count += max_x - min_x + 1
+
+  return count
+
+def landed_fixtures(fixtures):
+  '''
+  Returns copies of fixtures with their piece moved where the AI places it,
+  ready for integrate_piece.
+  '''
+  landed = []
+  for grid in fixtures:
+    grid = grid.copy()
+    bot = VirtualBot(grid)
+    bot.run()
+    bot.adjust_position()
+    grid.piece_pos[1] = bot.find_landing_y(grid, grid.piece_pos[0])
+    landed.append(grid)
+
+  return landed
+
+def bench_placements(fixtures, evaluate):
+  '''
+  Returns evaluated placements per second and the peak of memory allocated
+  by a single evaluation, None without tracemalloc.
+  '''
+  ais = [AI(grid) for grid in fixtures]
+  placement_count = sum(count_placements(grid) for grid in fixtures)
+
+  t0 = time.perf_counter()
+  for ai in ais:
+    evaluate(ai)
+  dt = time.perf_counter() - t0
+  if tracemalloc is None:
+    return placement_count / dt, None
+
+  # tracing restarts for every evaluation, tracemalloc.reset_peak() needing
+  # Python 3.9
+  peak = 0
+  for ai in ais:
+    tracemalloc.start()
+    evaluate(ai)
+    peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+  return placement_count / dt, peak
+
+def bench_import(modules, runs=10):
+  '''
+  Returns the median wall time, in seconds, of starting a fresh interpreter
+  that imports modules, which is what every worker process pays.
+  '''
+  code = 'import ' + ', '.join(modules) if modules else 'pass'
+  times = []
+  for _ in range(runs):
+    t0 = time.perf_counter()
+    subprocess.run(
+      [sys.executable, '-c', code], check=True,
+      cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    times.append(time.perf_counter() - t0)
+
+  return statistics.median(times)
+
+def engine_benchmark():
+  results = []
+  for grid_class in (Grid, BitGrid):
+    name = grid_class.__name__
+    fixtures = make_fixtures(200, grid_class)
+    landed = landed_fixtures(fixtures)
+    results += [
+      result(
+        name + '.is_there_collision',
+        time_op(grid_class.is_there_collision, lambda: fixtures),
+        'ns/call'
+      ),
+      result(
+        name + '.integrate_piece',
+        time_op(
+          grid_class.integrate_piece,
+          lambda: [grid.copy() for grid in landed]
+        ),
+        'ns/call'
+      ),
+      result(
+        name + '.compute_stats',
+        time_op(grid_class.compute_stats, lambda: fixtures),
+        'ns/call'
+      ),
+      result(
+        name + '.copy', time_op(grid_class.copy, lambda: fixtures), 'ns/call'
+      ),
+      result(
+        name + ' AI.run',
+        time_op(AI.run, lambda: [AI(grid) for grid in fixtures]) / 1000,
+        'us/piece'
+      ),
+    ]
+
+  return results
+
+def placements_benchmark():
+  results = []
+  for grid_class in (Grid, BitGrid):
+    fixtures = make_fixtures(200, grid_class)
+    evaluations = [('copy', copy_evaluation), ('apply/undo', AI.run)]
+    if BatchAI:
+      evaluations.append(('numpy', BatchAI.run))
+
+    for name, evaluate in evaluations:
+      rate, peak = bench_placements(fixtures, evaluate)
+      name = '{} {}'.format(grid_class.__name__, name)
+      results.append(result(name, rate, 'placements/s'))
+      if peak is not None:
+        results.append(result(name + ' peak', peak, 'bytes'))
+
+  return results
+
+def games_benchmark(count=2, seed=0):
+  '''
+  Plays count seeded games stopping at 800 rows with simulate_game.
+  '''
+  results = []
+  for grid_class in (Grid, BitGrid):
+    class CountingBot(VirtualBot):
+      pieces = 0
+
+      def run(self):
+        CountingBot.pieces += 1
+        VirtualBot.run(self)
+
+    t0 = time.perf_counter()
+    simulate_game(
+      count, print_stats=False, stop=True, grid_class=grid_class,
+      bot_class=CountingBot, seed=seed
+    )
+    dt = time.perf_counter() - t0
+    results.append(result(
+      grid_class.__name__ + ' simulate_game', CountingBot.pieces / dt,
+      'pieces/s'
+    ))
+
+  return results
+
+def imports_benchmark():
+  # importing ai used to pull in sdl2 and load every texture, as the
+  # renderer does now
+  results = []
+  reason = sdl_missing()
+  for modules in ((), ('ai',), ('ai', 'renderer', 'bot')):
+    name = 'import ' + (', '.join(modules) or 'nothing')
+    if reason and 'renderer' in modules:
+      results.append(skipped(name, reason))
+    else:
+      results.append(result(name, bench_import(modules) * 1000, 'ms'))
+
+  return results
+
+# placements a budgeted lookahead move may evaluate, about three greedy moves
+LOOKAHEAD_BUDGET = 64
+
+def bench_lookahead(fixtures, depth, beam_width, node_budget=None, seed=0):
+  '''
+  Returns placements evaluated per second and per move by BeamSearchAI
+  searching depth pieces, and the share of moves cut off by node_budget.
+  '''
+  rng = random.Random(seed)
+  ais = []
+  for grid in fixtures:
+    ai = BeamSearchAI(
+      grid, beam_width=beam_width, max_depth=depth, node_budget=node_budget
+    )
+    ai.preview = [rng.choice(pieces) for _ in range(depth - 1)]
+    ais.append(ai)
+
+  t0 = time.perf_counter()
+  for ai in ais:
+    ai.run()
+  dt = time.perf_counter() - t0
+
+  nodes = sum(ai.nodes for ai in ais)
+  cutoffs = sum(ai.cutoffs for ai in ais)
+  return nodes / dt, nodes / len(ais), cutoffs / len(ais)
+
+def lookahead_benchmark():
+  fixtures = make_fixtures(50, BitGrid)
+  results = []
+  for depth in (1, 2, 3):
+    for node_budget in (None, LOOKAHEAD_BUDGET):
+      rate, per_move, cutoffs = bench_lookahead(
+        fixtures, depth, 4, node_budget
+      )
+      name = 'depth {}'.format(depth)
+      if node_budget is not None:
+        name += ' budget {}'.format(node_budget)
+      results.append(result(name, rate, 'placements/s'))
+      results.append(result(name + ' per move', per_move, 'placements'))
+      if node_budget is not None:
+        results.append(result(name + ' cut off', cutoffs * 100, '%'))
+
+  return results
+
+def falling_frames(fixtures):
+  '''
+  Returns a grid for every row the fixtures' pieces fall through on their
+  way to where the AI places them, as the game would draw them.
+  '''
+  frames = []
+  for grid in landed_fixtures(fixtures):
+    landing_y = grid.piece_pos[1]
+    for y in range(1, landing_y + 1):
+      frame = grid.copy()
+      frame.piece_pos[1] = y
+      frames.append(frame)
+
+    frame = grid.copy()
+    frame.integrate_piece()
+    frames.append(frame)
+
+  return frames
+
+def bench_render(grid_renderer, window, frames, full):
+  '''
+  Returns frames drawn and presented per second, everything being redrawn
+  each frame when full is set.
+  '''
+  t0 = time.perf_counter()
+  for frame in frames:
+    grid_renderer.grid = frame
+    if full:
+      grid_renderer.invalidate()
+    grid_renderer.draw()
+    grid_renderer.present(window)
+  dt = time.perf_counter() - t0
+
+  return len(frames) / dt
+
+def render_benchmark():
+  os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+  reason = sdl_missing()
+  if reason:
+    return [skipped('render', reason)]
+
+  import sdl2
+  from renderer import GridRenderer, TextureGridRenderer
+
+  sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO)
+  frames = falling_frames(make_fixtures(50, Grid))
+  width = MAP_SIZE[0] * CELL_SIZE
+  height = MAP_SIZE[1] * CELL_SIZE
+
+  def window():
+    return sdl2.SDL_CreateWindow(
+      b'benchmark', 0, 0, width, height, sdl2.SDL_WINDOW_HIDDEN
+    )
+
+  results = []
+  surface_window = window()
+  surface = sdl2.SDL_GetWindowSurface(surface_window)
+  for name, full in (('surface full', True), ('surface dirty', False)):
+    grid_renderer = GridRenderer(frames[0], surface, CELL_SIZE)
+    results.append(result(
+      name, bench_render(grid_renderer, surface_window, frames, full),
+      'frames/s'
+    ))
+
+  renderer_window = window()
+  renderer = sdl2.SDL_CreateRenderer(renderer_window, -1, 0)
+  grid_renderer = TextureGridRenderer(frames[0], renderer, CELL_SIZE)
+  results.append(result(
+    'renderer', bench_render(grid_renderer, renderer_window, frames, False),
+    'frames/s'
+  ))
+
+  del grid_renderer
+  sdl2.SDL_DestroyRenderer(renderer)
+  sdl2.SDL_DestroyWindow(renderer_window)
+  sdl2.SDL_DestroyWindow(surface_window)
+  sdl2.SDL_Quit()
+  return results
+
+benchmarks = {
+  'engine': engine_benchmark,
+  'placements': placements_benchmark,
+  'games': games_benchmark,
+  'imports': imports_benchmark,
+  'lookahead': lookahead_benchmark,
+  'render': render_benchmark,
+}
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+    'names', nargs='*', metavar='name', help=', '.join(benchmarks)
+  )
+  parser.add_argument('--json', action='store_true')
+  parser.add_argument('--compare', metavar='JSON')
+  args = parser.parse_args()
+  for name in args.names:
+    if name not in benchmarks:
+      parser.error('unknown benchmark: ' + name)
+
+  report = {
+    'implementation': platform.python_implementation(),
+    'version': platform.python_version(),
+    'benchmarks': {},
+  }
+  for name in args.names or benchmarks:
+    report['benchmarks'][name] = benchmarks[name]()
+
+  baseline = {}
+  if args.compare:
+    with open(args.compare) as file:
+      for name, results in json.load(file)['benchmarks'].items():
+        for r in results:
+          if r['value'] is not None:
+            baseline[name, r['name']] = r['value']
+
+  if args.json:
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return
+
+  print(report['implementation'], report['version'])
+  for name, results in report['benchmarks'].items():
+    print('-' * 40)
+    print(name)
+    for r in results:
+      if r['value'] is None:
+        print('{:32} skipped: {}'.format(r['name'], r['skipped']))
+        continue
+
+      line = '{:32} {:12.1f} {}'.format(r['name'], r['value'], r['unit'])
+      old = baseline.get((name, r['name']))
+      if old:
+        line += '  {:.2f}x old'.format(r['value'] / old)
+      print(line)
+
+if __name__ == '__main__':
+  main()
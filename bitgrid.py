@@ -0,0 +1,96 @@
+from colors import Color
+from grid import Grid
+
+def shift_mask(mask, x):
+  # only empty matrix columns can end up left of the wall
+  return mask << x if x >= 0 else mask >> -x
+
+class BitGrid(Grid):
+  '''
+  Grid that stores occupancy as one integer bitmask per row, bit x being set
+  when column x is filled. The walls are set bits, so collision is an AND
+  against the piece's row masks and a full row equals full_row.
+  cells is still kept up to date, but only for drawing.
+  '''
+  def __init__(self, width, height):
+    Grid.__init__(self, width, height)
+    self.full_row = (1 << self.w) - 1
+    self.empty_row = 1 | (1 << (self.w - 1))
+
+    self.rows = (
+      [self.full_row]
+      + [self.empty_row for _ in range(self.h - 2)]
+      + [self.full_row]
+    )
+
+  def copy(self):
+    grid_copy = Grid.copy(self)
+    grid_copy.rows = self.rows.copy()
+    return grid_copy
+
+  def write_piece(self, placement, x, y, color):
+    for dy, mask in enumerate(placement.row_masks):
+      if mask:
+        self.rows[y + dy] |= shift_mask(mask, x)
+
+    Grid.write_piece(self, placement, x, y, color)
+
+  def erase_piece(self, placement, x, y):
+    for dy, mask in enumerate(placement.row_masks):
+      if mask:
+        self.rows[y + dy] &= ~shift_mask(mask, x)
+
+    Grid.erase_piece(self, placement, x, y)
+
+  def is_row_full(self, y):
+    return self.rows[y] == self.full_row
+
+  def remove_row(self, y):
+    del self.rows[y]
+    self.rows.insert(1, self.empty_row)
+    return Grid.remove_row(self, y)
+
+  def restore_row(self, y, row):
+    del self.rows[1]
+    self.rows.insert(y, self.full_row)
+    Grid.restore_row(self, y, row)
+
+  def row_masks(self):
+    return self.rows[1:self.h - 1]
+
+  def load_rows(self, masks, color=Color.DARK_GRAY):
+    self.rows[1:self.h - 1] = masks
+    Grid.load_rows(self, masks, color)
+
+  def is_there_collision(self):
+    x, y = self.piece_pos
+    rows = self.rows
+    for dy, mask in enumerate(self.piece.row_masks[self.piece.rot]):
+      if mask and rows[y + dy] & shift_mask(mask, x):
+        return True
+
+    return False
+
+  def rehash(self):
+    self.hash = 0
+    for y in range(1, self.h - 1):
+      row = self.rows[y] ^ self.empty_row
+      while row:
+        bit = row & -row
+        self.hash ^= self.zobrist_keys[y][bit.bit_length() - 1]
+        row ^= bit
+
+  def scan_column(self, x):
+    bit = 1 << x
+    height = 0
+    holes = 0
+    for y in range(1, self.h - 1):
+      if self.rows[y] & bit:
+        if height == 0:
+          height = self.h - 1 - y
+
+      elif height != 0:
+        holes += 1
+
+    self.heights[x] = height
+    self.column_holes[x] = holes
@@ -0,0 +1,29 @@
+import ctypes
+from sdl2 import *
+from ai import AI
+
+class Bot(AI):  
+  def adjust_position(self):
+    moved = False
+    x = self.grid.piece_pos[0]
+    if x < self.best_fit.x:
+      self.send_keypress(SDL_SCANCODE_RIGHT)
+      moved = True
+    elif x > self.best_fit.x:
+      self.send_keypress(SDL_SCANCODE_LEFT)
+      moved = True
+    
+    if self.grid.piece.rot != self.best_fit.rot:
+      self.send_keypress(SDL_SCANCODE_UP)
+      moved = True
+
+    if not moved:
+      self.send_keypress(SDL_SCANCODE_DOWN)
+  
+  def send_keypress(self, scancode):
+    new_event = SDL_Event()
+    new_event.type = SDL_KEYDOWN
+    new_event.key.keysym.scancode = scancode
+    SDL_PushEvent(ctypes.byref(new_event))
+    new_event.type = SDL_KEYUP
+    SDL_PushEvent(ctypes.byref(new_event))
@@ -1,19 +1,27 @@
 '''
-This module implements a genetic algorithm to find A, B, C and D.
-Run `python3 brkga.py` or `pypy3 brkga.py`, which is 10x faster.
+This module implements a genetic algorithm to find the AI weights A, B, C,
+D and E. Run `python3 brkga.py`, see `python3 brkga.py --help`.
+Needs NumPy: `pip3 install numpy`.
 '''
 
+import argparse
 import math
-import random
-import pickle
+import numpy as np
 import ai
 from pathlib import Path
 from multiprocessing import Pool 
 
+LOG_PATH = './tmp/brkga.log'
+
 class BRKGA:
+  '''
+  The population is an (individual_count, alleles_per_individual) array
+  with the fitnesses in a separate vector. Random numbers come from a
+  NumPy Generator seeded with seed.
+  '''
   def __init__(
     self, alleles_per_individual, individual_count, elite_percentage,
-    mutant_percentage, elite_chances
+    mutant_percentage, elite_chances, seed=None
   ):
     self.alleles_per_individual = alleles_per_individual
     self.individual_count = individual_count
@@ -22,82 +30,453 @@ class BRKGA:
     self.elite_chances = elite_chances
     self.generation = 0
 
-    self.population = []
-    for _ in range(individual_count):
-      # individual: fitness + alleles
-      i = [random.uniform(0,1) for _ in range(alleles_per_individual + 1)]
-      self.population.append(i)
-      
+    self.rng = np.random.default_rng(seed)
+    self.population = self.rng.random(
+      (individual_count, alleles_per_individual)
+    )
+    self.fitness = np.zeros(individual_count)
   
+  def sort_population(self, order=None):
+    '''
+    Reorders the population, by descending fitness when order is None.
+    '''
+    if order is None:
+      order = np.argsort(-self.fitness, kind='stable')
+
+    self.population = self.population[order]
+    self.fitness = self.fitness[order]
+
   def evolve(self):
-    # self.population.sort(reverse=True)
     # population must be sorted descending by fitness
     
     self.generation += 1
-    elite_pool = self.population[:self.elite_count]
-    general_pool = self.population[self.elite_count:]
-    temp_pool = []
-    mating_count = len(self.population) - self.elite_count - self.mutant_count
-
-    for _ in range(mating_count):
-      elite_individual = random.choice(elite_pool)
-      random_individual = random.choice(general_pool)
-
-      new_individual = [0.0]
-      for allele in range(1, self.alleles_per_individual + 1):
-        if random.uniform(0,1) < self.elite_chances:
-          new_individual.append(elite_individual[allele])
-        else:
-          new_individual.append(random_individual[allele])
-      
-      temp_pool.append(new_individual)
-    
-    mutant_pool = [
-      [random.uniform(0,1) for _ in range(self.alleles_per_individual + 1)]
-      for _ in range(self.mutant_count)
-    ]
+    rng = self.rng
+    individual_count = self.individual_count
+    mating_count = individual_count - self.elite_count - self.mutant_count
+
+    elite_parents = rng.integers(0, self.elite_count, mating_count)
+    other_parents = rng.integers(
+      self.elite_count, individual_count, mating_count
+    )
+    inherited = (
+      rng.random((mating_count, self.alleles_per_individual))
+      < self.elite_chances
+    )
+    children = np.where(
+      inherited,
+      self.population[elite_parents],
+      self.population[other_parents]
+    )
+    mutants = rng.random((self.mutant_count, self.alleles_per_individual))
+
+    self.population = np.concatenate(
+      (self.population[:self.elite_count], children, mutants)
+    )
+    self.fitness = np.concatenate((
+      self.fitness[:self.elite_count],
+      np.zeros(individual_count - self.elite_count)
+    ))
+
+class FitnessStats:
+  '''
+  Running mean and variance of the fitnesses measured for one individual.
+  '''
+  def __init__(self):
+    self.count = 0
+    self.mean = 0.0
+    self.m2 = 0.0
+
+  def add(self, fitness):
+    self.count += 1
+    delta = fitness - self.mean
+    self.mean += delta / self.count
+    self.m2 += delta * (fitness - self.mean)
+
+  @property
+  def variance(self):
+    return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+class FitnessStore:
+  '''
+  FitnessStats keyed by allele vector, and by the run's master seed when
+  the fitness was measured on seeded games. Every generation plays its own
+  games, so the runs of an individual that was evaluated again were
+  measured on different games.
+  '''
+  def __init__(self):
+    self.entries = {}
+
+  def get(self, alleles, seed=None):
+    return self.entries.get((tuple(alleles), seed))
+
+  def add(self, alleles, fitness, seed=None):
+    key = tuple(alleles), seed
+    if key not in self.entries:
+      self.entries[key] = FitnessStats()
+
+    stats = self.entries[key]
+    stats.add(fitness)
+    return stats
+
+race_seeds = None
 
-    self.population = elite_pool + temp_pool + mutant_pool
+def init_race_worker(seeds):
+  global race_seeds
+  race_seeds = seeds
+
+def play_counted_game(args):
+  '''
+  Plays the game of seed up to 800 rows, returns its score and the number
+  of pieces played.
+  '''
+  seed, a, b, c, d, e = args
+  session = ai.play_session(seed, a, b, c, d, e, True)
+  return session.score, session.pieces
+
+def play_race_game(args):
+  game, a, b, c, d, e = args
+  return play_counted_game((race_seeds[game], a, b, c, d, e))
+
+def dominated(contenders, fitness, scores, keep):
+  '''
+  Returns the contenders clearly below the keep-th one, whose fitness is
+  under its fitness and none of whose games reached it. contenders must be
+  sorted by descending fitness. The ones tied with the cutoff are kept, as
+  with few games capped at 800 rows many individuals tie.
+  '''
+  cutoff = fitness[contenders[keep - 1]]
+  return [
+    i for i in contenders[keep:]
+    if fitness[i] < cutoff and max(scores[i]) < cutoff
+  ]
 
 class TetrisBRKGA(BRKGA):
-  def __init__(self, fitness_simulation_count):
-    BRKGA.__init__(self, 5, 50, 0.2, 0.4, 0.7)
+  def __init__(
+    self, fitness_simulation_count, processes=None, reevaluate=False,
+    seed=None, racing=False, log_path=LOG_PATH
+  ):
+    '''
+    processes is the size of the simulation pool, None uses every core.
+    Individuals already in the fitness store aren't simulated again unless
+    reevaluate is set, then each new run is added to their running mean.
+    With a seed the evolution is reproducible. Every generation plays its
+    own games, from generation_seed, the same for all its individuals.
+    With racing, each generation is evaluated by TetrisBRKGA.race instead.
+    Every evaluated generation is appended to the log at log_path.
+    '''
+    BRKGA.__init__(self, 5, 50, 0.2, 0.4, 0.7, seed)
     self.fitness_simulation_count = fitness_simulation_count
+    self.processes = processes
+    self.reevaluate = reevaluate
+    self.seed = seed
+    self.racing = racing
+    self.fitness_store = FitnessStore()
+    self.games_played = 0
+    self.pieces_played = 0
+    self.log_path = log_path
   
   def evolve(self):
-    with Pool(processes=3) as pool:
-      results = []
-      for individual in self.population:
-        _, a, b, c, d, e = individual
-        r = pool.apply_async(ai.simulate_game, (16, a, b, c, d, e, False, True))
-        results.append(r)
-      
-      for i, r in enumerate(results):
-        fitness = r.get()
-        self.population[i][0] = fitness
-    
-    self.population.sort(reverse=True)
+    if self.racing:
+      self.race()
+    else:
+      self.evaluate()
+
     self.save_population()
     BRKGA.evolve(self)
+
+  def generation_seed(self):
+    '''
+    Returns the master seed of the current generation's games, None when
+    the run isn't seeded.
+    '''
+    return None if self.seed is None else self.seed + self.generation
+
+  def race(self):
+    '''
+    Races the generation on common random numbers. The generation's game
+    seeds are drawn once and handed to the workers when the pool starts,
+    so every individual plays the same piece sequences. All individuals
+    play 2 games. Then the individual ranked at the better half, or at
+    elite_count, sets the cutoff, the ones clearly below it are dropped
+    and the others play as many games again, until
+    fitness_simulation_count games or until only elite_count individuals
+    are left. The population ends up sorted with the individuals that
+    lasted longest first. games_played and pieces_played count what the
+    race simulated.
+    '''
+    count = self.fitness_simulation_count
+    seeds = ai.game_seeds(count, self.generation_seed())
+    population = self.population.tolist()
+    scores = [[] for _ in population]
+    contenders = list(range(len(population)))
+    eliminated = []
+    played = 0
+    games = min(2, count)
+    self.games_played = 0
+    self.pieces_played = 0
+
+    with Pool(self.processes, init_race_worker, (seeds,)) as pool:
+      while True:
+        tasks = [
+          (i, game) for i in contenders for game in range(played, games)
+        ]
+        results = pool.map(
+          play_race_game,
+          [(game, *population[i]) for i, game in tasks]
+        )
+        for (i, _), (score, pieces) in zip(tasks, results):
+          scores[i].append(score)
+          self.pieces_played += pieces
+
+        self.games_played += len(tasks)
+        played = games
+        for i in contenders:
+          self.fitness[i] = ai.score_stats(scores[i])[0]
+        contenders.sort(key=lambda i: self.fitness[i], reverse=True)
+
+        if played == count or len(contenders) <= self.elite_count:
+          break
+
+        keep = max(self.elite_count, (len(contenders) + 1) // 2)
+        dropped = set(dominated(contenders, self.fitness, scores, keep))
+        eliminated = [i for i in contenders if i in dropped] + eliminated
+        contenders = [i for i in contenders if i not in dropped]
+        games = min(2 * games, count)
+
+    self.sort_population(contenders + eliminated)
+
+  def evaluate(self):
+    '''
+    Simulates the individuals that aren't in the fitness store, or all of
+    them with reevaluate, on the generation's games. An individual
+    evaluated again in a later generation plays that generation's games,
+    so its runs average out the noise of different piece sequences.
+    games_played and pieces_played count what was simulated.
+    '''
+    seed = self.generation_seed()
+    population = self.population.tolist()
+    simulated = [
+      i for i, alleles in enumerate(population)
+      if self.reevaluate or self.fitness_store.get(alleles, self.seed) is None
+    ]
+    # the seeds are drawn per individual, as ai.simulate_game would, so
+    # unseeded runs still give every individual its own games
+    tasks = [
+      (i, game_seed) for i in simulated
+      for game_seed in ai.game_seeds(self.fitness_simulation_count, seed)
+    ]
+    scores = {i: [] for i in simulated}
+    self.games_played = len(tasks)
+    self.pieces_played = 0
+    if tasks:
+      with Pool(processes=self.processes) as pool:
+        results = pool.map(
+          play_counted_game,
+          [(game_seed, *population[i]) for i, game_seed in tasks]
+        )
+      for (i, _), (score, pieces) in zip(tasks, results):
+        scores[i].append(score)
+        self.pieces_played += pieces
+
+    for i, alleles in enumerate(population):
+      if i in scores:
+        stats = self.fitness_store.add(
+          alleles, ai.score_stats(scores[i])[0], self.seed
+        )
+      else:
+        stats = self.fitness_store.get(alleles, self.seed)
+      self.fitness[i] = stats.mean
+
+    self.sort_population()
   
   def save_population(self):
-    file = open('./tmp/{}'.format(self.generation), 'wb')
-    pickle.dump(self, file)
-    file.close()
+    '''
+    Appends the evaluated population and the Generator state to the log.
+    '''
+    with open(self.log_path, 'ab') as file:
+      file.write(
+        pack_record(self.generation, self.population, self.fitness, self.rng)
+      )
 
-if __name__ == '__main__':
-  Path('./tmp').mkdir(exist_ok=True)
-  brkga = TetrisBRKGA(16)
-  for generation in range(1000):  
+  def resume(self):
+    '''
+    Restores the last generation of the log and breeds the next one, as
+    evolve would have. A truncated last record is dropped from the log.
+    Returns False when the log has no generation.
+    '''
+    if not Path(self.log_path).exists():
+      return False
+
+    log = read_log(self.log_path)
+    with open(self.log_path, 'r+b') as file:
+      file.truncate(log.nbytes)
+
+    if not len(log):
+      return False
+
+    record = log[-1]
+    self.generation = int(record['generation'])
+    self.population = record['population'].copy()
+    self.fitness = record['fitness'].copy()
+    self.rng.bit_generator.state = unpack_rng_state(record)
+    BRKGA.evolve(self)
+    return True
+
+def record_dtype(individual_count, allele_count):
+  '''
+  A log record is the header, the fitness vector, the allele matrix and the
+  PCG64 state of the Generator. Every record of a run has the same size.
+  '''
+  return np.dtype([
+    ('generation', '<u4'),
+    ('individual_count', '<u4'),
+    ('allele_count', '<u4'),
+    ('fitness', '<f8', (individual_count,)),
+    ('population', '<f8', (individual_count, allele_count)),
+    # low and high 64 bits of the state and the increment
+    ('rng_state', '<u8', (4,)),
+    ('has_uint32', '<u4'),
+    ('uinteger', '<u4'),
+  ])
+
+def pack_record(generation, population, fitness, rng):
+  record = np.zeros(1, record_dtype(*population.shape))
+  record['generation'] = generation
+  record['individual_count'], record['allele_count'] = population.shape
+  record['fitness'] = fitness
+  record['population'] = population
+
+  state = rng.bit_generator.state
+  record['rng_state'] = [
+    value >> shift & 0xffffffffffffffff
+    for value in (state['state']['state'], state['state']['inc'])
+    for shift in (0, 64)
+  ]
+  record['has_uint32'] = state['has_uint32']
+  record['uinteger'] = state['uinteger']
+  return record.tobytes()
+
+def unpack_rng_state(record):
+  low_state, high_state, low_inc, high_inc = (
+    int(value) for value in record['rng_state']
+  )
+  return {
+    'bit_generator': 'PCG64',
+    'state': {
+      'state': high_state << 64 | low_state,
+      'inc': high_inc << 64 | low_inc,
+    },
+    'has_uint32': int(record['has_uint32']),
+    'uinteger': int(record['uinteger']),
+  }
+
+def read_log(path=LOG_PATH):
+  '''
+  Returns the complete records of a log as a structured array, a
+  truncated last record is left out.
+  '''
+  header = np.fromfile(path, '<u4', 3)
+  if len(header) < 3:
+    return np.zeros(0, record_dtype(0, 0))
+
+  dtype = record_dtype(*header[1:])
+  data = np.fromfile(path, np.uint8)
+  count = len(data) // dtype.itemsize
+  return data[:count * dtype.itemsize].view(dtype)
+
+def read_fitness_history(path=LOG_PATH):
+  '''
+  Returns the generations and fitness vectors of a log.
+  '''
+  log = read_log(path)
+  return log['generation'], log['fitness']
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+    '--resume', action='store_true',
+    help='continue from the last generation of the log'
+  )
+  parser.add_argument(
+    '--history', action='store_true',
+    help="print the log's best fitness of every generation and exit"
+  )
+  parser.add_argument(
+    '--overwrite', action='store_true',
+    help='start a new run even though the log exists, deleting it'
+  )
+  parser.add_argument('--log', default=LOG_PATH)
+  parser.add_argument(
+    '--games', type=int, default=16,
+    help='games played to evaluate an individual'
+  )
+  parser.add_argument(
+    '--processes', type=int,
+    help='size of the simulation pool, every core by default'
+  )
+  parser.add_argument(
+    '--seed', type=int,
+    help='makes the evolution reproducible, every individual playing the '
+    'same games; pass it again with --resume'
+  )
+  parser.add_argument(
+    '--racing', action='store_true',
+    help='race each generation on common games, dropping the individuals '
+    'clearly below the better half'
+  )
+  parser.add_argument(
+    '--reevaluate', action='store_true',
+    help='play the individuals already evaluated again, averaging the runs'
+  )
+  args = parser.parse_args()
+
+  if args.history:
+    if not Path(args.log).exists():
+      parser.error("{} doesn't exist".format(args.log))
+
+    generations, fitness = read_fitness_history(args.log)
+    if not len(generations):
+      print(args.log, 'has no complete generation')
+      return
+
+    for generation, best_fitness in zip(generations, fitness.max(axis=1)):
+      print(generation, best_fitness)
+    return
+
+  log_path = Path(args.log)
+  if log_path.exists() and not args.resume:
+    if not args.overwrite:
+      parser.error(
+        '{} exists, pass --resume to continue it or --overwrite to start '
+        'over'.format(args.log)
+      )
+    log_path.unlink()
+
+  log_path.parent.mkdir(parents=True, exist_ok=True)
+
+  brkga = TetrisBRKGA(
+    args.games, args.processes, args.reevaluate, args.seed, args.racing,
+    args.log
+  )
+  if args.resume and brkga.resume():
+    print('resuming after generation', brkga.generation - 1)
+
+  while brkga.generation < 1000:
+    generation = brkga.generation
     brkga.evolve()
 
     best_individual = brkga.population[0]
     print('-' * 20)
     print('generation:', generation)
-    print('fitness:', best_individual[0])
-    print('A =', best_individual[1])
-    print('B =', best_individual[2])
-    print('C =', best_individual[3])
-    print('D =', best_individual[4])
-    print('E =', best_individual[5])
-    print('-' * 20)
\ No newline at end of file
+    print('fitness:', brkga.fitness[0])
+    print('games:', brkga.games_played)
+    print('pieces:', brkga.pieces_played)
+    print('A =', best_individual[0])
+    print('B =', best_individual[1])
+    print('C =', best_individual[2])
+    print('D =', best_individual[3])
+    print('E =', best_individual[4])
+    print('-' * 20)
+
+if __name__ == '__main__':
+  main()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+from collections import deque
+
+def percentile(sorted_samples, p):
+  index = min(len(sorted_samples) - 1, int(p * len(sorted_samples)))
+  return sorted_samples[index]
+
+class FrameTimer:
+  '''
+  Times the phases of every frame. Call start_frame, then mark(phase) when
+  each phase ends, then end_frame. A phase marked several times in a frame
+  is summed. Keeps the last window frames of each phase, a phase only
+  being recorded in the frames it ran. The whole frame is recorded as
+  'frame' when it was drawn and as 'step' when it only ran simulation
+  steps, and the drawn frames whose work took longer than budget
+  nanoseconds are counted. Nothing is counted with a budget of 0, when
+  frames are drawn as often as possible.
+  '''
+  def __init__(self, budget, window=1000):
+    self.budget = budget
+    self.window = window
+    self.samples = {}
+    self.current = {}
+    self.frames = 0
+    self.overruns = 0
+
+  def start_frame(self):
+    self.current.clear()
+    self.frame_start = self.last = time.perf_counter_ns()
+
+  def mark(self, phase):
+    now = time.perf_counter_ns()
+    self.current[phase] = self.current.get(phase, 0) + now - self.last
+    self.last = now
+
+  def end_frame(self, drawn=True):
+    frame_time = self.last - self.frame_start
+    self.current['frame' if drawn else 'step'] = frame_time
+    for phase, phase_time in self.current.items():
+      if phase not in self.samples:
+        self.samples[phase] = deque(maxlen=self.window)
+      self.samples[phase].append(phase_time)
+
+    if drawn:
+      self.frames += 1
+      if self.budget and frame_time > self.budget:
+        self.overruns += 1
+
+  def stats(self):
+    '''
+    Returns {phase: (p50, p95, p99, max)} in nanoseconds.
+    '''
+    stats = {}
+    for phase, samples in self.samples.items():
+      samples = sorted(samples)
+      stats[phase] = (
+        percentile(samples, 0.5),
+        percentile(samples, 0.95),
+        percentile(samples, 0.99),
+        samples[-1]
+      )
+
+    return stats
+
+  def report(self):
+    if self.budget:
+      overruns = '{} over {:.1f} ms'.format(self.overruns, self.budget / 1e6)
+    else:
+      overruns = 'not counted, uncapped'
+
+    lines = [
+      'frames    : {}'.format(self.frames),
+      'overruns  : ' + overruns,
+      '{:16} {:>9} {:>9} {:>9} {:>9} (ms, last {} frames)'.format(
+        'phase', 'p50', 'p95', 'p99', 'max', self.window
+      ),
+    ]
+    for phase, values in self.stats().items():
+      lines.append('{:16} {:9.3f} {:9.3f} {:9.3f} {:9.3f}'.format(
+        phase, *(value / 1e6 for value in values)
+      ))
+
+    return '\n'.join(lines)
+
+  def dump(self, path):
+    with open(path, 'w') as file:
+      file.write(self.report() + '\n')
+
+class NullFrameTimer:
+  '''
+  Stands in for FrameTimer when timing is off.
+  '''
+  def start_frame(self):
+    pass
+
+  def mark(self, phase):
+    pass
+
+  def end_frame(self, drawn=True):
+    pass
@@ -1,18 +1,27 @@
-import ctypes
-from sdl2 import SDL_BlitSurface, SDL_Rect
+import random
 from colors import Color
-from textures import textures
-from pieces import Piece
+from placements import placements
+
+# zobrist_tables[width, height][y][x] is a random key for cell (x, y), the
+# hash of a board is the xor of the keys of its filled cells between walls
+zobrist_tables = {}
+
+def zobrist_keys(width, height):
+  if (width, height) not in zobrist_tables:
+    rng = random.Random(0)
+    zobrist_tables[width, height] = [
+      [rng.getrandbits(64) for _ in range(width)] for _ in range(height)
+    ]
+
+  return zobrist_tables[width, height]
 
 class Collision(Exception):
   pass
 
 class Grid:
-  def __init__(self, window_surface, width, height, cell_size):
-    self.window_surface = window_surface
+  def __init__(self, width, height):
     self.w = width
     self.h = height
-    self.cell_size = cell_size
     self.cells = []
 
     # top wall
@@ -25,17 +34,29 @@ class Grid:
     
     # bottom wall
     self.cells.append([Color.GRAY for _ in range(self.w)])
+
+    self.heights = [self.h - 2] + [0 for _ in range(self.w - 2)] + [self.h - 2]
+    self.column_holes = [0 for _ in range(self.w)]
+    self.holes = 0
+    self.aggregate_height = 0
+    self.bumpiness = 0
+    self.wells_depth = 0
+
+    self.zobrist_keys = zobrist_keys(self.w, self.h)
+    self.hash = 0
   
   def copy(self):
-    grid_copy = Grid(self.window_surface, self.w, self.h, self.cell_size)
+    grid_copy = self.__class__(self.w, self.h)
     grid_copy.cells = [row.copy() for row in self.cells]
+    grid_copy.heights = self.heights.copy()
+    grid_copy.column_holes = self.column_holes.copy()
+    grid_copy.holes = self.holes
+    grid_copy.aggregate_height = self.aggregate_height
+    grid_copy.bumpiness = self.bumpiness
+    grid_copy.wells_depth = self.wells_depth
+    grid_copy.hash = self.hash
     try:
-      grid_copy.piece = Piece(
-        self.piece.matrices,
-        self.piece.color,
-        self.piece.unique_rotations
-      )
-      grid_copy.piece.rot = self.piece.rot
+      grid_copy.piece = self.piece.copy()
       grid_copy.piece_pos = self.piece_pos.copy()
     except AttributeError:
       pass
@@ -69,41 +90,131 @@ class Grid:
     Adds the piece's cells to the grid and remove the piece.
     Clears the filled rows and returns how many rows were cleared.
     '''
-    cleared_rows = 0
-
-    for y, row in enumerate(self.piece.matrix):
-      for x, filled in enumerate(row):
-        if not filled:
-          continue
-
-        self.cells[self.piece_pos[1]+y][self.piece_pos[0]+x] = self.piece.color
-    
-    for y, row in enumerate(self.piece.matrix):
-      for has_block in row:
-        if has_block:
-          break
-
-      if has_block:
-        for _, color in enumerate(self.cells[self.piece_pos[1] + y]):
-          if color == Color.BLACK:
-            break
-        else:
-          cleared_rows += 1
-          first_row = [Color.GRAY for _ in range(self.w)]
-          second_row = (
-            [Color.GRAY] + [Color.BLACK for _ in range(self.w-2)] + [Color.GRAY]
-          )
-          del self.cells[self.piece_pos[1] + y]
-          del self.cells[0]
-          self.cells[:0] = first_row, second_row
+    cleared_rows, _ = self.place(self.piece, self.piece.rot, *self.piece_pos)
 
     del self.piece
     del self.piece_pos
 
-    self.compute_stats()
-
     return cleared_rows
 
+  def place(self, piece, rot, x, y, update_stats=True):
+    '''
+    Writes piece with rotation rot at (x, y), clears the filled rows and
+    refreshes the stats, without touching self.piece.
+    Returns how many rows were cleared and a record for undo().
+    With update_stats=False the stats are left stale until refresh_stats()
+    is called with the record.
+    '''
+    placement = placements[piece.color][rot]
+    saved_state = self.save_state()
+    self.write_piece(placement, x, y, piece.color)
+
+    cleared = []
+    for dy in range(placement.top, placement.bottom + 1):
+      if self.is_row_full(y + dy):
+        cleared.append((y + dy, self.remove_row(y + dy)))
+
+    if cleared:
+      self.rehash()
+
+    record = placement, x, y, cleared, saved_state
+    if update_stats:
+      self.refresh_stats(record)
+
+    return len(cleared), record
+
+  def refresh_stats(self, record):
+    placement, x, _, cleared, _ = record
+    self.update_stats(
+      range(x + placement.left, x + placement.right + 1),
+      [self.h - 1 - row_y for row_y, _ in cleared]
+    )
+
+  def undo(self, record):
+    '''
+    Reverts a place() call. Records must be undone in reverse order.
+    '''
+    placement, x, y, cleared, saved_state = record
+    for row_y, row in reversed(cleared):
+      self.restore_row(row_y, row)
+
+    self.erase_piece(placement, x, y)
+    self.restore_state(saved_state)
+
+  def write_piece(self, placement, x, y, color):
+    for dx, dy in placement.cells:
+      self.cells[y + dy][x + dx] = color
+      self.hash ^= self.zobrist_keys[y + dy][x + dx]
+
+  def erase_piece(self, placement, x, y):
+    for dx, dy in placement.cells:
+      self.cells[y + dy][x + dx] = Color.BLACK
+      self.hash ^= self.zobrist_keys[y + dy][x + dx]
+
+  def rehash(self):
+    self.hash = 0
+    for y in range(1, self.h - 1):
+      for x in range(1, self.w - 1):
+        if self.cells[y][x] != Color.BLACK:
+          self.hash ^= self.zobrist_keys[y][x]
+
+  def is_row_full(self, y):
+    return Color.BLACK not in self.cells[y]
+
+  def remove_row(self, y):
+    '''
+    Deletes row y, shifting down the rows above it, and returns it.
+    '''
+    row = self.cells.pop(y)
+    self.cells.insert(
+      1, [Color.GRAY] + [Color.BLACK for _ in range(self.w-2)] + [Color.GRAY]
+    )
+    return row
+
+  def restore_row(self, y, row):
+    del self.cells[1]
+    self.cells.insert(y, row)
+
+  def save_state(self):
+    '''
+    Returns the stats and the hash, for restore_state().
+    '''
+    return (
+      self.heights.copy(), self.column_holes.copy(), self.holes,
+      self.aggregate_height, self.bumpiness, self.wells_depth, self.hash
+    )
+
+  def restore_state(self, saved_state):
+    (
+      heights, column_holes, self.holes,
+      self.aggregate_height, self.bumpiness, self.wells_depth, self.hash
+    ) = saved_state
+    self.heights[:] = heights
+    self.column_holes[:] = column_holes
+
+  def row_masks(self):
+    '''
+    Returns one bitmask per row between the top and bottom walls, bit x
+    being set when column x, walls included, is filled.
+    '''
+    return [
+      sum(1 << x for x, color in enumerate(row) if color != Color.BLACK)
+      for row in self.cells[1:self.h - 1]
+    ]
+
+  def load_rows(self, masks, color=Color.DARK_GRAY):
+    '''
+    Fills the board from row_masks() output, with color as the colors of
+    the cells aren't kept in the masks, and recomputes the stats and hash.
+    '''
+    for y, mask in enumerate(masks, 1):
+      row = self.cells[y]
+      for x in range(1, self.w - 1):
+        row[x] = color if mask >> x & 1 else Color.BLACK
+
+    self.compute_stats()
+    self.rehash()
+
   def is_there_collision(self):
     for y, row in enumerate(self.piece.matrix):
       for x, filled in enumerate(row):
@@ -114,61 +225,57 @@ class Grid:
 
     return False
   
-  def draw(self):
-    dest_rect = SDL_Rect()
-    dest_rect.w = self.cell_size
-    dest_rect.h = self.cell_size
-    for y, row in enumerate(self.cells):
-      for x, cell in enumerate(row):
-        dest_rect.x = x * self.cell_size
-        dest_rect.y = y * self.cell_size
-        SDL_BlitSurface(
-          textures[cell],
-          None,
-          self.window_surface,
-          ctypes.byref(dest_rect)
-        )
-    
-    try:
-      self.draw_piece()
-    except AttributeError:
-      pass
-  
-  def draw_piece(self):
-    dest_rect = SDL_Rect(w=self.cell_size, h=self.cell_size)
+  def compute_stats(self):
+    '''
+    Rescans every column, then recomputes the board stats.
+    '''
+    for x in range(1, self.w - 1):
+      self.scan_column(x)
 
-    for y, row in enumerate(self.piece.matrix):
-      for x, filled in enumerate(row):
-        if not filled:
+    self.compute_aggregates()
+
+  def update_stats(self, columns, cleared_levels):
+    '''
+    Refreshes the stats after cells were written to columns and the rows
+    at cleared_levels (heights counted before the clear) were removed.
+    Only the written columns and the columns whose top was cleared are
+    rescanned, every other column just drops by the cleared row count.
+    '''
+    if cleared_levels:
+      for x in range(1, self.w - 1):
+        if x in columns:
           continue
-        
-        dest_rect.x = (self.piece_pos[0] + x) * self.cell_size
-        dest_rect.y = (self.piece_pos[1] + y) * self.cell_size
-        SDL_BlitSurface(
-          textures[self.piece.color],
-          None,
-          self.window_surface,
-          ctypes.byref(dest_rect)
-        )
-  
-  def compute_stats(self):
-    heights = [self.h - 2] + [0 for _ in range(self.w - 2)] + [self.h - 2]
-    
-    self.holes = 0
-    self.aggregate_height = 0
-    self.bumpiness = 0
-    self.wells_depth = 0
+        if self.heights[x] in cleared_levels:
+          self.scan_column(x)
+        else:
+          self.heights[x] -= len(cleared_levels)
+
+    for x in columns:
+      self.scan_column(x)
 
+    self.compute_aggregates()
+
+  def scan_column(self, x):
+    height = 0
+    holes = 0
     for y in range(1, self.h - 1):
-      for x in range(1, self.w - 1):
-        if self.cells[y][x] != Color.BLACK:
-          if heights[x] == 0:
-            h = self.h - 1 - y
-            heights[x] = h
-            self.aggregate_height += h
+      if self.cells[y][x] != Color.BLACK:
+        if height == 0:
+          height = self.h - 1 - y
 
-        elif heights[x] != 0:
-          self.holes += 1
+      elif height != 0:
+        holes += 1
+
+    self.heights[x] = height
+    self.column_holes[x] = holes
+
+  def compute_aggregates(self):
+    heights = self.heights
+
+    self.holes = sum(self.column_holes)
+    self.aggregate_height = sum(heights[1:-1])
+    self.bumpiness = 0
+    self.wells_depth = 0
     
     for x in range(2, self.w - 1):
       self.bumpiness += abs(heights[x] - heights[x - 1])
@@ -177,4 +284,4 @@ class Grid:
       minh = min(heights[x - 1], heights[x + 1])
       dh = minh - heights[x]
       if dh >= 3:
-        self.wells_depth += dh
\ No newline at end of file
+        self.wells_depth += dh
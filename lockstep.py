@@ -0,0 +1,144 @@
+'''
+Plays many AI games in lock-step with NumPy. The boards of all games are
+one array and every step places one piece in each running game, choosing
+its placement with batch.score_boards. Games that are over are masked out.
+Given the same seed it returns exactly what ai.simulate_game returns.
+Needs NumPy: `pip3 install numpy`.
+'''
+
+import random
+import numpy as np
+from ai import A, B, C, D, E, game_seeds, print_score_stats, score_stats
+from batch import clear_rows, score_boards
+from pieces import pieces
+from placements import placements, SPAWN_Y
+from session import SPAWN_X
+from settings import *
+
+PIECE_IDS = range(len(pieces))
+
+# x positions tried for every rotation, the walls rule out the extra ones
+XS = np.arange(-3, MAP_SIZE[0])
+SPAWN_SLOT = int(np.flatnonzero(XS == SPAWN_X)[0])
+
+# CELLS[piece, rot, cell] is the (dx, dy) offset of each of the 4 cells
+CELLS = np.array([
+  [placements[piece.color][rot].cells for rot in range(4)] for piece in pieces
+])
+UNIQUE_ROTATIONS = np.array([
+  [rot in piece.unique_rotations for rot in range(4)] for piece in pieces
+])
+
+def new_boards(count, width, height):
+  '''
+  Returns count empty boards with their walls, padded with filled rows
+  below the bottom wall so every piece row can be indexed.
+  '''
+  boards = np.zeros((count, height + 3, width), dtype=bool)
+  boards[:, 0] = True
+  boards[:, height - 1:] = True
+  boards[:, :, 0] = True
+  boards[:, :, width - 1] = True
+  return boards
+
+def place_pieces(boards, piece_ids, a, b, c, d, e):
+  '''
+  Places piece_ids[i] on boards[i] as the AI would and clears the full
+  rows. Returns the new boards, the cleared row counts and a mask of the
+  games that could place their piece, the others being game over.
+  '''
+  count, padded_height, width = boards.shape
+  height = padded_height - 3
+  games = np.arange(count)[:, None, None, None, None]
+
+  # piece cells for every (game, rot, x) slot
+  cells = CELLS[piece_ids]
+  xs = cells[:, :, None, :, 0] + XS[None, None, :, None]
+  dys = cells[:, :, None, :, 1]
+  inside = ((xs >= 0) & (xs < width)).all(axis=3)
+  xs = np.clip(xs, 0, width - 1)
+
+  # collisions[game, rot, x, y] for the piece placed at row y
+  ys = np.arange(height)[:, None]
+  collisions = boards[
+    games, dys[:, :, :, None, :] + ys, xs[:, :, :, None, :]
+  ].any(axis=4)
+  collisions |= ~inside[:, :, :, None]
+
+  # like AI.find_min_max_x, columns are reachable from the spawn position
+  unique_rotations = UNIQUE_ROTATIONS[piece_ids]
+  free = ~collisions[:, :, :, SPAWN_Y]
+  reachable = np.zeros_like(free)
+  reachable[:, :, SPAWN_SLOT:] = np.logical_and.accumulate(
+    free[:, :, SPAWN_SLOT:], axis=2
+  )
+  reachable[:, :, :SPAWN_SLOT + 1] = np.logical_and.accumulate(
+    free[:, :, SPAWN_SLOT::-1], axis=2
+  )[:, :, ::-1]
+  valid = reachable & unique_rotations[:, :, None]
+  placed = ~(unique_rotations & ~free[:, :, SPAWN_SLOT]).any(axis=1)
+  valid &= placed[:, None, None]
+
+  # the piece rests one row above its first collision below the spawn row
+  landing = collisions[:, :, :, SPAWN_Y + 1:].argmax(axis=3) + SPAWN_Y
+
+  # only the valid slots are built and scored
+  slot_count = 4 * len(XS)
+  valid = valid.reshape(count, slot_count)
+  placed &= valid.any(axis=1)
+  slot_games, slots = np.nonzero(valid)
+  rows = (landing[:, :, :, None] + dys - 1).reshape(count, slot_count, 4)
+  cols = (xs - 1).reshape(count, slot_count, 4)
+
+  candidates = boards[slot_games, 1:height - 1, 1:width - 1]
+  candidates[
+    np.arange(len(slots))[:, None],
+    rows[slot_games, slots],
+    cols[slot_games, slots]
+  ] = True
+
+  fitnesses = np.full((count, slot_count), -np.inf)
+  fitnesses[slot_games, slots] = score_boards(candidates, a, b, c, d, e)
+  best = fitnesses.argmax(axis=1)
+
+  # index of each game's best slot among the built candidates
+  candidate_counts = valid.sum(axis=1)
+  first_candidate = np.cumsum(candidate_counts) - candidate_counts
+  chosen = first_candidate + valid.cumsum(axis=1)[np.arange(count), best] - 1
+  chosen, cleared = clear_rows(candidates[chosen[placed]])
+
+  boards = boards.copy()
+  boards[placed, 1:height - 1, 1:width - 1] = chosen
+  cleared_rows = np.zeros(count, dtype=int)
+  cleared_rows[placed] = cleared
+  return boards, cleared_rows, placed
+
+def simulate_games(
+  count, a=A, b=B, c=C, d=D, e=E, print_stats=True, stop=False, seed=None
+):
+  rngs = [random.Random(game_seed) for game_seed in game_seeds(count, seed)]
+  boards = new_boards(count, MAP_SIZE[0], MAP_SIZE[1])
+  scores = np.zeros(count, dtype=int)
+  running = np.ones(count, dtype=bool)
+
+  while running.any():
+    games = np.flatnonzero(running)
+    piece_ids = np.array([rngs[game].choice(PIECE_IDS) for game in games])
+    boards[games], cleared, placed = place_pieces(
+      boards[games], piece_ids, a, b, c, d, e
+    )
+    scores[games] += cleared
+
+    over = ~placed
+    if stop:
+      over |= scores[games] >= 800
+    running[games[over]] = False
+
+  scores = scores.tolist()
+  if print_stats:
+    print_score_stats(scores)
+
+  return score_stats(scores)[0]
+
+if __name__ == '__main__':
+  simulate_games(100)
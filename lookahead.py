@@ -0,0 +1,129 @@
+'''
+AI that looks ahead at the pieces of a preview queue with a beam search.
+'''
+
+from ai import A, B, C, D, E, AI, PossibleFit, VirtualBot
+from grid import Collision
+from placements import SPAWN_Y
+from session import SPAWN_X
+
+class Node:
+  def __init__(self, fitness, cleared_rows, path):
+    self.fitness = fitness
+    self.cleared_rows = cleared_rows
+    # (piece, rot, x, y) of every placement from the current board
+    self.path = path
+
+class BeamSearchAI(AI):
+  '''
+  Searches the current piece and up to max_depth - 1 pieces of self.preview.
+  Only the beam_width best boards of each depth are expanded. With
+  node_budget, once a move has evaluated that many placements no more
+  boards are expanded, past the first depth, and the best board of the
+  deepest depth reached is played. Counts the placements evaluated and the
+  moves cut off by the budget.
+  '''
+  def __init__(
+    self, grid, a=A, b=B, c=C, d=D, e=E, beam_width=4, max_depth=3,
+    node_budget=None
+  ):
+    AI.__init__(self, grid, a, b, c, d, e)
+    self.beam_width = beam_width
+    self.max_depth = max_depth
+    self.node_budget = node_budget
+    self.preview = []
+    self.nodes = 0
+    self.moves = 0
+    self.cutoffs = 0
+
+  def run(self):
+    grid = self.grid
+    search_pieces = [grid.piece] + self.preview[:self.max_depth - 1]
+    beam = [Node(0.0, 0, ())]
+    budget_end = None
+    if self.node_budget is not None:
+      budget_end = self.nodes + self.node_budget
+    self.moves += 1
+    best_leaf = None
+    first_moves = None
+
+    for depth, piece in enumerate(search_pieces):
+      children = []
+      cut_off = False
+      for node in beam:
+        if depth and budget_end is not None and self.nodes >= budget_end:
+          cut_off = True
+          break
+
+        children.extend(self.expand(node, piece, depth))
+
+      if depth == 0:
+        first_moves = children
+      if not children:
+        break
+
+      if cut_off or depth == len(search_pieces) - 1:
+        best_leaf = max(children, key=lambda child: child.fitness)
+      if cut_off:
+        self.cutoffs += 1
+        break
+
+      children.sort(key=lambda child: child.fitness, reverse=True)
+      beam = children[:self.beam_width]
+
+    if best_leaf is None:
+      # every line ends the game before the last piece, play greedily
+      if not first_moves:
+        return
+      best_leaf = max(first_moves, key=lambda child: child.fitness)
+
+    _, rot, x, _ = best_leaf.path[0]
+    self.best_fit = PossibleFit(best_leaf.fitness, x, rot)
+
+  def expand(self, node, piece, depth):
+    '''
+    Returns the children of node for the given piece. Its path is replayed
+    on the grid, the piece spawned and every placement evaluated, then the
+    grid is restored.
+    '''
+    grid = self.grid
+    records = [grid.place(*placement)[1] for placement in node.path]
+    current_piece = grid.piece
+    current_pos = grid.piece_pos
+    if depth:
+      grid.piece = piece.spawn()
+      grid.piece_pos = [SPAWN_X, SPAWN_Y]
+
+    children = []
+    try:
+      if not grid.is_there_collision():
+        for rot, x, y in self.candidates():
+          if y is None:
+            continue
+
+          fitness, filled_rows = self.evaluate(
+            grid.piece, rot, x, y, node.cleared_rows
+          )
+          self.nodes += 1
+          children.append(Node(
+            fitness,
+            node.cleared_rows + filled_rows,
+            node.path + ((grid.piece, rot, x, y),)
+          ))
+
+    except Collision:
+      # a rotation collides at the spawn, that's game over
+      if not depth:
+        raise
+      children = []
+
+    finally:
+      grid.piece = current_piece
+      grid.piece_pos = current_pos
+      for record in reversed(records):
+        grid.undo(record)
+
+    return children
+
+class VirtualBeamSearchBot(BeamSearchAI, VirtualBot):
+  pass
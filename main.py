@@ -1,16 +1,25 @@
 import sys
-import ctypes
 import random
+import ctypes
 from sdl2 import *
 from sdl2.sdlttf import TTF_Init, TTF_Quit
 from grid import Grid, Collision
-from pieces import pieces
+from bitgrid import BitGrid
+from session import GameSession
+from replay import ReplayRecorder
 from gameclock import GameClock, Clock
-from actionhandler import ActionHandler
+from actionhandler import ActionHandler, InputQueue
 from score import Score
-from ai import Bot
+from bot import Bot
+from planner import SpeculativePlanner
+from renderer import GridRenderer, TextureGridRenderer
+from frametimer import FrameTimer, NullFrameTimer
+from pacer import FramePacer
 from settings import *
 
+TIMING_PATH = 'frame_timing.txt'
+REPLAY_PATH = 'game.replay'
+
 def run():
   SDL_Init(SDL_INIT_VIDEO)
   TTF_Init()
@@ -19,73 +28,150 @@ def run():
     b'Tetris', SDL_WINDOWPOS_CENTERED, SDL_WINDOWPOS_CENTERED, 
     MAP_SIZE[0] * CELL_SIZE, MAP_SIZE[1] * CELL_SIZE, SDL_WINDOW_SHOWN
   )
-  window_surface = SDL_GetWindowSurface(window)
 
-  grid = Grid(window_surface, MAP_SIZE[0], MAP_SIZE[1], CELL_SIZE)
-  grid.add_piece(random.choice(pieces), 4, 1)
+  grid_class = BitGrid if '--bitboard' in sys.argv else Grid
+  if '--record' in sys.argv:
+    # seeded so the replay's pieces can be checked against their source
+    seed = random.getrandbits(64)
+    recorder = ReplayRecorder(REPLAY_PATH, seed)
+  else:
+    seed = None
+    recorder = None
+  session = GameSession(grid_class, seed, recorder=recorder)
+  grid = session.grid
+  if '--renderer' in sys.argv:
+    window_surface = None
+    renderer = SDL_CreateRenderer(window, -1, 0)
+    grid_renderer = TextureGridRenderer(grid, renderer, CELL_SIZE)
+  else:
+    window_surface = SDL_GetWindowSurface(window)
+    renderer = None
+    grid_renderer = GridRenderer(grid, window_surface, CELL_SIZE)
 
   clock = Clock()
-  game_clock = GameClock(clock, FALLING_PER_SECOND)
+  draw_time = 0 if '--uncapped' in sys.argv else DRAW_TIME
+  pacer = FramePacer(clock, STEP_TIME, draw_time, MAX_CATCH_UP_STEPS)
+  # gravity and key repeats follow the simulation steps
+  game_clock = GameClock(pacer.sim_clock, FALLING_PER_SECOND)
   game_clock.start()
-  action_handler = ActionHandler(grid, clock, ACTIONS_PER_SECOND)
-  action_handler.start()
-  score = Score(window_surface, (MAP_SIZE[0] - 1) * CELL_SIZE - 8, CELL_SIZE)
+  action_handler = ActionHandler(session, pacer.sim_clock, ACTIONS_PER_SECOND)
+  input_queue = InputQueue()
+  score = Score(
+    window_surface, (MAP_SIZE[0] - 1) * CELL_SIZE - 8, CELL_SIZE, renderer
+  )
 
   if '--ai' in sys.argv:
     ai = Bot(grid)
     ai.run()
+    planner = SpeculativePlanner(ai)
+    planner.speculate()
+    # a frame waiting for the GIL waits for the switch interval, 5 ms by
+    # default, while the planner thread runs
+    sys.setswitchinterval(0.0005)
   else:
     ai = False
 
+  if '--timing' in sys.argv:
+    timer = FrameTimer(draw_time)
+  else:
+    timer = NullFrameTimer()
+
   running = True
   event = SDL_Event()
   while running:
     clock.update_time()
-    t0 = clock.time
+    timer.start_frame()
+    steps = pacer.steps()
+    draw = pacer.draw_due()
 
-    if ai:
+    # the bot presses one key per drawn frame
+    if ai and draw:
       ai.adjust_position()
+      timer.mark('bot')
 
+    input_queue.pump()
     while SDL_PollEvent(ctypes.byref(event)):
       if event.type == SDL_QUIT:
         running = False
+      elif (
+        event.type == SDL_WINDOWEVENT
+        and event.window.event == SDL_WINDOWEVENT_EXPOSED
+      ):
+        grid_renderer.invalidate()
 
-      action_handler.handle_keypress_event(event)
-    
-    action_handler.execute_actions()
+    for key_event in input_queue.pop_events():
+      action_handler.handle_key(*key_event)
     
-    for _ in range(game_clock.get_ticks()):
-      try:
-        grid.move_piece(0, 1)
-      except Collision:
-        try:
-          grid.move_piece(0, -1)
-          score.add(grid.integrate_piece())
-          new_piece = random.choice(pieces)
-          new_piece.reset_rotation()
-          grid.add_piece(new_piece, 4, 1)
-          if ai:
-            ai.run()
-        except Collision:
+    timer.mark('events')
+    for _ in range(steps):
+      if not running:
+        break
+
+      pacer.step()
+      action_handler.execute_actions()
+      timer.mark('actions')
+
+      for _ in range(game_clock.get_ticks()):
+        cleared_rows = session.drop()
+        if cleared_rows:
+          # the text is drawn over the cells, repaint them under both texts
+          grid_renderer.damage(score.dest_rect)
+          score.add(cleared_rows)
+          grid_renderer.damage(score.dest_rect)
+
+        if cleared_rows is not None and ai and not session.game_over:
+          timer.mark('gravity')
+          try:
+            planner.plan()
+          except Collision:
+            # a rotation collides at the spawn, that's game over
+            session.game_over = True
+          timer.mark('bot')
+
+        if session.game_over:
           print('-' * 40)
           print('Game over')
-          print('You scored:', score.score)
+          print('You scored:', session.score)
           print('-' * 40)
           running = False
-    
-    grid.draw()
-    score.draw()
+          break
 
-    SDL_UpdateWindowSurface(window)
-    
-    clock.update_time()
-    t1 = clock.time
-    dt = t1 - t0
-    if dt < DRAW_TIME:
-      SDL_Delay((DRAW_TIME - dt) // 1000000)
+      timer.mark('gravity')
+
+    if draw:
+      grid_renderer.draw([score.dest_rect])
+      timer.mark('grid draw')
+      if grid_renderer.is_damaged(score.dest_rect):
+        score.draw()
+      timer.mark('score draw')
+
+      grid_renderer.present(window)
+      timer.mark('update window')
+    timer.end_frame(draw)
+    pacer.wait()
   
+  if ai:
+    planner.stop()
+
+  input_queue.close()
+  if recorder:
+    recorder.close(session)
+    print('game recorded to', REPLAY_PATH)
+
+  if '--timing' in sys.argv:
+    timer.dump(TIMING_PATH)
+    with open(TIMING_PATH, 'a') as file:
+      file.write(action_handler.latency_report() + '\n')
+      file.write(pacer.report() + '\n')
+      if ai:
+        file.write(planner.report() + '\n')
+    print('frame timings written to', TIMING_PATH)
+
   # avoid calling TTF_CloseFont() after TTF_Quit(), which causes a SEGFAULT
   del score
+  del grid_renderer
+  if renderer:
+    SDL_DestroyRenderer(renderer)
     
   SDL_DestroyWindow(window)
   TTF_Quit()
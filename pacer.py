@@ -0,0 +1,131 @@
+'''
+Paces the game loop: the simulation advances in fixed steps while frames
+are drawn at their own rate, and the loop sleeps until the next of them is
+due.
+'''
+
+import time
+from collections import deque
+from gameclock import Clock
+from frametimer import percentile
+
+class FramePacer:
+  '''
+  Runs a simulation step every step_time nanoseconds of clock time and
+  draws a frame every draw_time, or on every iteration when draw_time is 0.
+  self.sim_clock advances one step_time per step, so whatever is driven
+  from it sees a fixed timestep. After a stall at most max_steps steps run
+  at once and the rest of the late ones are skipped, the game slowing down
+  instead of catching up in a burst. Keeps the intervals between the last
+  window frames drawn and counts the frames that couldn't be drawn in
+  time. clock is read through its time attribute, wait() reads the time
+  with now() and sleeps with sleep(), so tests can drive all of them.
+  '''
+  def __init__(
+    self, clock, step_time, draw_time, max_steps=5, spin_time=1000000,
+    window=1000, now=time.monotonic_ns, sleep=time.sleep
+  ):
+    self.clock = clock
+    self.now = now
+    self.sleep = sleep
+    self.step_time = step_time
+    self.draw_time = draw_time
+    self.max_steps = max_steps
+    # sleeps wake up as much as half a millisecond late, the last
+    # spin_time before a deadline is waited for by spinning
+    self.spin_time = spin_time
+    self.window = window
+    self.sim_clock = Clock()
+    self.sim_clock.time = clock.time
+    self.next_step = clock.time
+    self.next_draw = clock.time
+    self.last_draw = None
+    self.intervals = deque(maxlen=window)
+    self.frames = 0
+    self.dropped_frames = 0
+    self.skipped_steps = 0
+
+  def steps(self):
+    '''
+    Returns how many simulation steps are due, at most max_steps. Call
+    step() before running each of them.
+    '''
+    now = self.clock.time
+    if now < self.next_step:
+      return 0
+
+    steps = (now - self.next_step) // self.step_time + 1
+    self.next_step += steps * self.step_time
+    if steps > self.max_steps:
+      self.skipped_steps += steps - self.max_steps
+      steps = self.max_steps
+
+    return steps
+
+  def step(self):
+    self.sim_clock.time += self.step_time
+
+  def draw_due(self):
+    '''
+    Returns whether a frame should be drawn now. The frames whose time
+    passed entirely before this one are counted as dropped.
+    '''
+    now = self.clock.time
+    if now < self.next_draw:
+      return False
+
+    if self.draw_time:
+      late_frames = (now - self.next_draw) // self.draw_time
+      self.dropped_frames += late_frames
+      self.next_draw += (late_frames + 1) * self.draw_time
+
+    if self.last_draw is not None:
+      self.intervals.append(now - self.last_draw)
+    self.last_draw = now
+    self.frames += 1
+    return True
+
+  def wait(self):
+    '''
+    Sleeps, then spins, until the next step or frame is due. Doesn't wait
+    when uncapped.
+    '''
+    if not self.draw_time:
+      return
+
+    deadline = min(self.next_step, self.next_draw)
+    remaining = deadline - self.now()
+    if remaining > self.spin_time:
+      self.sleep((remaining - self.spin_time) / 1e9)
+    while self.now() < deadline:
+      pass
+
+  def report(self):
+    lines = [
+      'drawn frames  : {}'.format(self.frames),
+      'dropped frames: {}'.format(self.dropped_frames),
+      'skipped steps : {}'.format(self.skipped_steps),
+    ]
+    if not self.intervals:
+      return '\n'.join(lines)
+
+    rows = [('frame interval', sorted(self.intervals))]
+    if self.draw_time:
+      rows.append(('jitter', sorted(
+        abs(interval - self.draw_time) for interval in self.intervals
+      )))
+
+    lines.append('{:16} {:>9} {:>9} {:>9} {:>9} (ms, last {} frames)'.format(
+      '', 'p50', 'p95', 'p99', 'max', self.window
+    ))
+    for name, samples in rows:
+      lines.append('{:16} {:9.3f} {:9.3f} {:9.3f} {:9.3f}'.format(
+        name, *(value / 1e6 for value in (
+          percentile(samples, 0.5),
+          percentile(samples, 0.95),
+          percentile(samples, 0.99),
+          samples[-1]
+        ))
+      ))
+
+    return '\n'.join(lines)
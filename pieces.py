@@ -12,7 +12,26 @@ class Piece:
     self.matrices = matrices
     self.color = color
     self.unique_rotations = unique_rotations
+    # one bitmask per matrix row, bit x set when column x is filled
+    self.row_masks = tuple(
+      tuple(sum(filled << x for x, filled in enumerate(row)) for row in m)
+      for m in matrices
+    )
   
+  def copy(self):
+    piece_copy = Piece.__new__(Piece)
+    piece_copy.__dict__.update(self.__dict__)
+    return piece_copy
+
+  def spawn(self):
+    '''
+    Returns a copy at rotation 0 to play with. The pieces of this module
+    are shared flyweights and are never rotated themselves.
+    '''
+    piece = self.copy()
+    piece.rot = 0
+    return piece
+
   @property
   def matrix(self):
     return self.matrices[self.rot]
@@ -0,0 +1,66 @@
+'''
+Placement tables built once from pieces.pieces, so the AI can get the legal
+columns and the landing row of a drop from a lookup instead of moving the
+piece until Collision is raised.
+'''
+
+from pieces import pieces
+
+# rows a spawned piece's matrix covers, counting from the top wall
+SPAWN_Y = 1
+SPAWN_ROWS = 4
+
+class Placement:
+  '''
+  Shape of one piece rotation: its occupied cells as (x, y) matrix offsets,
+  its left/right/top/bottom extents, the bottom profile of each occupied
+  column and the row bitmasks used by BitGrid.
+  '''
+  def __init__(self, matrix, row_masks):
+    self.cells = tuple(
+      (x, y)
+      for y, row in enumerate(matrix)
+      for x, filled in enumerate(row)
+      if filled
+    )
+    self.left = min(x for x, _ in self.cells)
+    self.right = max(x for x, _ in self.cells)
+    self.top = min(y for _, y in self.cells)
+    self.bottom = max(y for _, y in self.cells)
+
+    # (column offset, lowest filled row offset) for each occupied column
+    self.profile = tuple(
+      (dx, max(y for x, y in self.cells if x == dx))
+      for dx in range(self.left, self.right + 1)
+    )
+    self.row_masks = row_masks
+
+  def min_max_x(self, width):
+    return 1 - self.left, width - 2 - self.right
+
+  def landing_y(self, heights, x, height):
+    '''
+    Returns the row the piece stops at when dropped straight down in column
+    x, given the column heights of a grid of the given height.
+    Only valid while nothing is above the piece's starting position.
+    '''
+    return min(
+      height - 1 - heights[x + dx] - bottom for dx, bottom in self.profile
+    ) - 1
+
+# placements[piece.color][rot], every piece has its own color
+placements = {
+  piece.color: tuple(
+    Placement(matrix, row_masks)
+    for matrix, row_masks in zip(piece.matrices, piece.row_masks)
+  )
+  for piece in pieces
+}
+
+def is_spawn_area_clear(grid):
+  '''
+  True when no filled cell reaches the rows a spawned piece covers, then
+  every column between the walls is reachable from the spawn position and
+  drops can be resolved with Placement.landing_y.
+  '''
+  return max(grid.heights[1:-1]) <= grid.h - 1 - SPAWN_Y - SPAWN_ROWS
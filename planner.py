@@ -0,0 +1,136 @@
+'''
+Plans the bot's next piece in a background thread while the current one
+falls.
+'''
+
+import queue
+import threading
+import time
+from ai import AI
+from grid import Collision
+from pieces import pieces
+from placements import placements, is_spawn_area_clear, SPAWN_Y
+from session import SPAWN_X
+
+class SpeculativePlanner:
+  '''
+  Once the current piece has a plan, the board it will leave is predicted
+  and a worker thread plans every piece on it. When the next piece spawns,
+  its plan is looked up by the grid's hash and the piece color, so a board
+  that doesn't match the prediction simply misses and is planned
+  synchronously. Plans of older predictions are dropped. Every request is
+  marked done on self.requests once planned, so requests.join() waits for
+  the worker.
+  '''
+  def __init__(self, ai):
+    self.ai = ai
+    self.plans = {}
+    self.generation = 0
+    self.lock = threading.Lock()
+    self.requests = queue.Queue()
+    self.hits = 0
+    self.misses = 0
+    self.thread = threading.Thread(target=self.work, daemon=True)
+    self.thread.start()
+
+  def speculate(self):
+    '''
+    Predicts the board left by the current piece once ai.best_fit is
+    played and has the worker plan every piece on it. Nothing is planned
+    when the piece can't be placed there.
+    '''
+    with self.lock:
+      self.generation += 1
+      self.plans = {}
+
+    board = self.predict_board()
+    if board is not None:
+      with self.lock:
+        self.requests.put((self.generation, board))
+
+  def predict_board(self):
+    '''
+    Returns a copy of the grid with the current piece placed at
+    ai.best_fit and no piece, None when it can't be placed. The landing row
+    comes from the placement table only when the spawn area is clear, as
+    in AI.candidates.
+    '''
+    ai = self.ai
+    board = ai.grid.copy()
+    piece = board.piece
+    rot, x = ai.best_fit.rot, ai.best_fit.x
+    if is_spawn_area_clear(board):
+      y = placements[piece.color][rot].landing_y(board.heights, x, board.h)
+    else:
+      piece.rot = rot
+      y = ai.find_landing_y(board, x)
+      if y is None:
+        return None
+
+    board.place(piece, rot, x, y)
+    del board.piece
+    del board.piece_pos
+    return board
+
+  def work(self):
+    while True:
+      generation, board = self.requests.get()
+      if board is not None:
+        self.plan_pieces(generation, board)
+      self.requests.task_done()
+      if board is None:
+        return
+
+  def plan_pieces(self, generation, board):
+    ai = self.ai
+    for piece in pieces:
+      if generation != self.generation:
+        break
+
+      spawned = board.copy()
+      try:
+        spawned.add_piece(piece.spawn(), SPAWN_X, SPAWN_Y)
+      except Collision:
+        continue
+
+      planner_ai = AI(spawned, ai.a, ai.b, ai.c, ai.d, ai.e)
+      try:
+        planner_ai.run()
+      except Collision:
+        # a rotation collides at the spawn, left to the synchronous plan
+        continue
+
+      best_fit = getattr(planner_ai, 'best_fit', None)
+      with self.lock:
+        if best_fit and generation == self.generation:
+          self.plans[board.hash, piece.color] = best_fit
+
+      # let the game loop take the GIL between plans
+      time.sleep(0)
+
+  def plan(self):
+    '''
+    Sets ai.best_fit for the piece that just spawned, then speculates on
+    the next one.
+    '''
+    ai = self.ai
+    with self.lock:
+      best_fit = self.plans.get((ai.grid.hash, ai.grid.piece.color))
+
+    if best_fit is None:
+      self.misses += 1
+      ai.run()
+    else:
+      self.hits += 1
+      ai.best_fit = best_fit
+
+    self.speculate()
+
+  def report(self):
+    return 'planner: {} plans hit, {} missed'.format(self.hits, self.misses)
+
+  def stop(self):
+    with self.lock:
+      self.generation += 1
+      self.requests.put((self.generation, None))
+    self.thread.join()
@@ -0,0 +1,250 @@
+import ctypes
+import sdl2
+from sdl2 import (
+  SDL_BlitSurface, SDL_Rect, SDL_UpdateWindowSurfaceRects,
+  SDL_CreateRGBSurfaceWithFormat, SDL_PIXELFORMAT_ARGB8888, SDL_FreeSurface,
+  SDL_CreateTextureFromSurface, SDL_DestroyTexture, SDL_RenderCopy,
+  SDL_RenderPresent
+)
+from colors import Color
+from textures import textures
+
+# SDL_RenderGeometry needs SDL 2.0.18
+HAS_RENDER_GEOMETRY = sdl2.dll.version >= 2018
+
+class GridRenderer:
+  '''
+  Draws the grid and its piece, redrawing only the cells that changed since
+  the previous frame. The cells as last drawn are kept in self.drawn, None
+  meaning everything must be redrawn, after exposure for instance. When
+  more than max_rects cells changed, on a line clear for instance, the
+  whole grid is redrawn and presented as one rect.
+  '''
+  def __init__(self, grid, window_surface, cell_size, max_rects=32):
+    self.grid = grid
+    self.window_surface = window_surface
+    self.cell_size = cell_size
+    self.max_rects = max_rects
+    self.drawn = None
+    self.damaged = set()
+    self.last_damaged = set()
+    self.rects = []
+    self.blits = 0
+
+  def invalidate(self):
+    self.drawn = None
+
+  def cells_in(self, rect):
+    '''
+    Returns the cells overlapped by the pixel rect.
+    '''
+    cell_size = self.cell_size
+    x0 = max(0, rect.x // cell_size)
+    y0 = max(0, rect.y // cell_size)
+    x1 = min(self.grid.w - 1, (rect.x + rect.w - 1) // cell_size)
+    y1 = min(self.grid.h - 1, (rect.y + rect.h - 1) // cell_size)
+    return {(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)}
+
+  def damage(self, rect):
+    '''
+    Makes the next draw() redraw the cells under rect, for instance where
+    text drawn over the grid changed.
+    '''
+    self.damaged |= self.cells_in(rect)
+
+  def is_damaged(self, rect):
+    '''
+    Tells whether the last draw() redrew a cell under rect.
+    '''
+    return not self.last_damaged.isdisjoint(self.cells_in(rect))
+
+  def frame_cells(self):
+    grid = self.grid
+    cells = [row.copy() for row in grid.cells]
+    try:
+      piece = grid.piece
+      piece_x, piece_y = grid.piece_pos
+    except AttributeError:
+      return cells
+
+    for y, row in enumerate(piece.matrix):
+      for x, filled in enumerate(row):
+        if filled:
+          cells[piece_y + y][piece_x + x] = piece.color
+
+    return cells
+
+  def draw(self, overlays=()):
+    '''
+    Redraws the changed cells and returns the SDL_Rects to present.
+    overlays are the rects of what's drawn over the grid afterwards, text
+    blended over the cells for instance. When a cell under one of them is
+    redrawn, every cell under it is, so the overlay isn't blended again
+    over its own pixels.
+    '''
+    cells = self.frame_cells()
+    damaged = self.damaged
+    self.damaged = set()
+    full = self.drawn is None
+    if not full:
+      for y, (row, drawn_row) in enumerate(zip(cells, self.drawn)):
+        if row != drawn_row:
+          damaged.update(
+            (x, y) for x, cell in enumerate(row) if cell != drawn_row[x]
+          )
+      for rect in overlays:
+        overlay_cells = self.cells_in(rect)
+        if not damaged.isdisjoint(overlay_cells):
+          damaged |= overlay_cells
+      full = len(damaged) > self.max_rects
+
+    if full:
+      damaged = {
+        (x, y) for y in range(self.grid.h) for x in range(self.grid.w)
+      }
+
+    cell_size = self.cell_size
+    dest_rect = SDL_Rect(w=cell_size, h=cell_size)
+    for x, y in damaged:
+      dest_rect.x = x * cell_size
+      dest_rect.y = y * cell_size
+      SDL_BlitSurface(
+        textures[cells[y][x]],
+        None,
+        self.window_surface,
+        ctypes.byref(dest_rect)
+      )
+
+    self.drawn = cells
+    self.last_damaged = damaged
+    self.blits = len(damaged)
+    if full:
+      self.rects = [
+        SDL_Rect(0, 0, self.grid.w * cell_size, self.grid.h * cell_size)
+      ]
+    else:
+      self.rects = [
+        SDL_Rect(x * cell_size, y * cell_size, cell_size, cell_size)
+        for x, y in damaged
+      ]
+
+    return self.rects
+
+  def present(self, window):
+    rects = self.rects
+    if rects:
+      SDL_UpdateWindowSurfaceRects(
+        window, (SDL_Rect * len(rects))(*rects), len(rects)
+      )
+
+class TextureGridRenderer(GridRenderer):
+  '''
+  Draws the grid with an SDL_Renderer. The tiles are copied once into a
+  texture atlas and the whole grid is submitted as one SDL_RenderGeometry
+  call, with 4 vertices per cell, only the texture coordinates of the
+  changed cells being rewritten. With SDL older than 2.0.18 every cell is
+  an SDL_RenderCopy, which SDL batches itself. The frame is rebuilt every
+  time, so everything counts as damaged.
+  '''
+  def __init__(self, grid, renderer, cell_size):
+    GridRenderer.__init__(self, grid, None, cell_size)
+    self.renderer = renderer
+    self.atlas_slots = {color: i for i, color in enumerate(Color)}
+    self.make_atlas()
+    if HAS_RENDER_GEOMETRY:
+      self.make_geometry()
+
+  def __del__(self):
+    SDL_DestroyTexture(self.atlas)
+
+  def make_atlas(self):
+    cell_size = self.cell_size
+    surface = SDL_CreateRGBSurfaceWithFormat(
+      0, cell_size * len(self.atlas_slots), cell_size, 32,
+      SDL_PIXELFORMAT_ARGB8888
+    )
+    for color, slot in self.atlas_slots.items():
+      dest_rect = SDL_Rect(slot * cell_size, 0, cell_size, cell_size)
+      SDL_BlitSurface(textures[color], None, surface, ctypes.byref(dest_rect))
+
+    self.atlas = SDL_CreateTextureFromSurface(self.renderer, surface)
+    SDL_FreeSurface(surface)
+
+  def make_geometry(self):
+    # PySDL2 builds without SDL 2.0.18 support don't have SDL_Vertex
+    from sdl2 import SDL_Vertex
+
+    grid = self.grid
+    cell_size = self.cell_size
+    cell_count = grid.w * grid.h
+    self.vertices = (SDL_Vertex * (4 * cell_count))()
+    self.indices = (ctypes.c_int * (6 * cell_count))()
+    corners = ((0, 0), (1, 0), (1, 1), (0, 1))
+    for cell in range(cell_count):
+      x, y = cell % grid.w, cell // grid.w
+      for corner, (dx, dy) in enumerate(corners):
+        vertex = self.vertices[4 * cell + corner]
+        vertex.position.x = (x + dx) * cell_size
+        vertex.position.y = (y + dy) * cell_size
+        vertex.color.r = vertex.color.g = vertex.color.b = 255
+        vertex.color.a = 255
+        vertex.tex_coord.y = dy
+
+      for i, corner in enumerate((0, 1, 2, 0, 2, 3)):
+        self.indices[6 * cell + i] = 4 * cell + corner
+
+  def set_cell(self, x, y, color):
+    slot_width = 1 / len(self.atlas_slots)
+    u = self.atlas_slots[color] * slot_width
+    first = 4 * (y * self.grid.w + x)
+    vertices = self.vertices
+    vertices[first].tex_coord.x = u
+    vertices[first + 1].tex_coord.x = u + slot_width
+    vertices[first + 2].tex_coord.x = u + slot_width
+    vertices[first + 3].tex_coord.x = u
+
+  def is_damaged(self, rect):
+    return True
+
+  def draw(self, overlays=()):
+    cells = self.frame_cells()
+    if HAS_RENDER_GEOMETRY:
+      drawn = self.drawn
+      for y, row in enumerate(cells):
+        if drawn is not None and row == drawn[y]:
+          continue
+
+        for x, color in enumerate(row):
+          if drawn is None or color != drawn[y][x]:
+            self.set_cell(x, y, color)
+
+      sdl2.SDL_RenderGeometry(
+        self.renderer, self.atlas, self.vertices, len(self.vertices),
+        self.indices, len(self.indices)
+      )
+      self.blits = 1
+    else:
+      self.draw_copies(cells)
+
+    self.drawn = cells
+    self.damaged = set()
+    return []
+
+  def draw_copies(self, cells):
+    cell_size = self.cell_size
+    src_rect = SDL_Rect(w=cell_size, h=cell_size)
+    dest_rect = SDL_Rect(w=cell_size, h=cell_size)
+    for y, row in enumerate(cells):
+      for x, color in enumerate(row):
+        src_rect.x = self.atlas_slots[color] * cell_size
+        dest_rect.x = x * cell_size
+        dest_rect.y = y * cell_size
+        SDL_RenderCopy(
+          self.renderer, self.atlas, ctypes.byref(src_rect),
+          ctypes.byref(dest_rect)
+        )
+
+    self.blits = len(cells) * len(cells[0])
+
+  def present(self, window):
+    SDL_RenderPresent(self.renderer)
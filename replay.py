@@ -0,0 +1,227 @@
+'''
+Records games to compact binary replays and reads them back.
+
+A replay is a header, then blocks of one keyframe followed by
+KEYFRAME_INTERVAL placements, the last block holding the remaining ones,
+then a trailer. Every placement is a little endian uint16:
+
+  bits 0-2   index of the piece in pieces.pieces
+  bits 3-4   rotation
+  bits 5-8   x + 3
+  bits 9-13  y
+
+A keyframe is the score and the number of pieces placed before the block,
+then the board's rows between the walls as uint16 bitmasks, see
+Grid.row_masks(). As every block but the last has the same size, piece n
+is found without reading the blocks before it. The trailer holds the final
+piece count, score and board hash.
+'''
+
+import struct
+from grid import Grid
+from pieces import pieces
+from placements import placements
+
+MAGIC = b'TRPL'
+TRAILER_MAGIC = b'TEND'
+VERSION = 1
+KEYFRAME_INTERVAL = 256
+
+# magic, version, has seed, width, height, keyframe interval, seed
+HEADER = struct.Struct('<4sBBBBHQ')
+# magic, pieces, score, board hash
+TRAILER = struct.Struct('<4sIIQ')
+# score, pieces
+KEYFRAME_HEAD = struct.Struct('<II')
+PLACEMENT = struct.Struct('<H')
+
+PIECE_INDEXES = {piece.color: index for index, piece in enumerate(pieces)}
+
+class ReplayError(Exception):
+  pass
+
+def pack_placement(piece_index, rot, x, y):
+  return piece_index | rot << 3 | (x + 3) << 5 | y << 9
+
+def unpack_placement(value):
+  '''
+  Returns the piece index, rotation, x and y of a packed placement.
+  '''
+  return value & 7, value >> 3 & 3, (value >> 5 & 15) - 3, value >> 9
+
+def fits(width, height):
+  '''
+  Tells whether every placement on a width x height board fits the 4 bits
+  of x + 3 and the 5 bits of y, and every row the 16 bits of a keyframe
+  row.
+  '''
+  shapes = [shape for rotations in placements.values() for shape in rotations]
+  max_x = max(shape.min_max_x(width)[1] for shape in shapes)
+  min_x = min(shape.min_max_x(width)[0] for shape in shapes)
+  max_y = height - 2 - min(shape.bottom for shape in shapes)
+  return width <= 16 and 0 <= min_x + 3 and max_x + 3 <= 15 and max_y <= 31
+
+def keyframe_struct(height):
+  return struct.Struct('<{}H'.format(height - 2))
+
+class ReplayRecorder:
+  '''
+  Writes the game of a GameSession given recorder=self to path, record()
+  being called by the session before every piece lands. close() writes
+  the trailer and must be called once the game is over or abandoned.
+  seed is the session's seed, None when the pieces came from random. It's
+  stored in 64 bits, a seed out of 0..2**64 - 1 is refused before anything
+  is written.
+  '''
+  def __init__(self, path, seed=None, interval=KEYFRAME_INTERVAL):
+    if seed is not None and not 0 <= seed < 1 << 64:
+      raise ReplayError(
+        'seed {} can\'t be recorded, it must be in 0..2**64 - 1'.format(seed)
+      )
+
+    self.file = open(path, 'wb')
+    self.seed = seed
+    self.interval = interval
+    self.count = 0
+    self.block = bytearray()
+    self.keyframe = None
+
+  def write_header(self, grid):
+    if not fits(grid.w, grid.h):
+      raise ReplayError(
+        'a {}x{} board can\'t be recorded'.format(grid.w, grid.h)
+      )
+
+    self.keyframe = keyframe_struct(grid.h)
+    self.file.write(HEADER.pack(
+      MAGIC, VERSION, self.seed is not None, grid.w, grid.h, self.interval,
+      self.seed or 0
+    ))
+
+  def record(self, session):
+    grid = session.grid
+    if self.count % self.interval == 0:
+      if self.keyframe is None:
+        self.write_header(grid)
+
+      self.file.write(self.block)
+      self.block = bytearray(KEYFRAME_HEAD.pack(session.score, self.count))
+      self.block += self.keyframe.pack(*grid.row_masks())
+
+    piece = grid.piece
+    x, y = grid.piece_pos
+    self.block += PLACEMENT.pack(
+      pack_placement(PIECE_INDEXES[piece.color], piece.rot, x, y)
+    )
+    self.count += 1
+
+  def close(self, session):
+    if self.keyframe is None:
+      self.write_header(session.grid)
+
+    self.file.write(self.block)
+    self.file.write(TRAILER.pack(
+      TRAILER_MAGIC, self.count, session.score, session.grid.hash
+    ))
+    self.file.close()
+
+class ReplayReader:
+  '''
+  Reads a replay lazily: the header and trailer are read when it's opened,
+  the blocks only when placements() or seek() need them.
+  '''
+  def __init__(self, path):
+    self.file = open(path, 'rb')
+    try:
+      header = self.file.read(HEADER.size)
+      if len(header) < HEADER.size:
+        raise ReplayError('truncated header')
+
+      (
+        magic, version, has_seed, self.width, self.height, self.interval,
+        seed
+      ) = HEADER.unpack(header)
+      if magic != MAGIC or version != VERSION:
+        raise ReplayError('not a version {} replay'.format(VERSION))
+
+      self.seed = seed if has_seed else None
+      self.keyframe = keyframe_struct(self.height)
+      self.block_size = (
+        KEYFRAME_HEAD.size + self.keyframe.size
+        + self.interval * PLACEMENT.size
+      )
+
+      self.file.seek(-TRAILER.size, 2)
+      magic, self.piece_count, self.score, self.hash = TRAILER.unpack(
+        self.file.read(TRAILER.size)
+      )
+      if magic != TRAILER_MAGIC:
+        raise ReplayError('missing trailer, the recording wasn\'t closed')
+    except Exception:
+      self.file.close()
+      raise
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    self.file.close()
+
+  def read_block(self, block):
+    '''
+    Returns the score, piece count and row masks of the keyframe of block,
+    and the packed placements following it.
+    '''
+    self.file.seek(HEADER.size + block * self.block_size)
+    count = min(self.interval, self.piece_count - block * self.interval)
+    data = self.file.read(
+      KEYFRAME_HEAD.size + self.keyframe.size + count * PLACEMENT.size
+    )
+    score, pieces_placed = KEYFRAME_HEAD.unpack_from(data)
+    masks = self.keyframe.unpack_from(data, KEYFRAME_HEAD.size)
+    placements = struct.unpack_from(
+      '<{}H'.format(count), data, KEYFRAME_HEAD.size + self.keyframe.size
+    )
+    return score, pieces_placed, masks, placements
+
+  def placements(self, start=0):
+    '''
+    Yields the piece index, rotation, x and y of the placements from
+    piece start on, reading one block at a time.
+    '''
+    for block in range(start // self.interval, self.block_count()):
+      placements = self.read_block(block)[3]
+      if block == start // self.interval:
+        placements = placements[start % self.interval:]
+
+      for value in placements:
+        yield unpack_placement(value)
+
+  def block_count(self):
+    return (self.piece_count + self.interval - 1) // self.interval
+
+  def seek(self, n, grid_class=Grid):
+    '''
+    Returns a grid_class board after the first n placements and the score
+    at that point, replaying from the nearest keyframe. Cells restored from
+    the keyframe take Grid.load_rows()'s default color.
+    '''
+    if not 0 <= n <= self.piece_count:
+      raise ReplayError('piece {} out of 0..{}'.format(n, self.piece_count))
+
+    grid = grid_class(self.width, self.height)
+    if n == 0:
+      return grid, 0
+
+    # after the last block, its placements are replayed to the end
+    block = min(n // self.interval, self.block_count() - 1)
+    score, _, masks, placements = self.read_block(block)
+    grid.load_rows(masks)
+    for value in placements[:n - block * self.interval]:
+      piece_index, rot, x, y = unpack_placement(value)
+      score += grid.place(pieces[piece_index], rot, x, y)[0]
+
+    return grid, score
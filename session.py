@@ -0,0 +1,140 @@
+'''
+The rules of a game without drawing or timing, shared by main.run, which
+drives it from the clock, and ai.play_game, which runs it as fast as it can.
+'''
+
+import random
+from collections import deque
+from enum import Enum, auto
+from grid import Grid, Collision
+from pieces import pieces
+from placements import placements, is_spawn_area_clear, SPAWN_Y
+from settings import *
+
+SPAWN_X = 4
+
+class Action(Enum):
+  LEFT   = auto()
+  RIGHT  = auto()
+  DOWN   = auto()
+  ROTATE = auto()
+
+class PieceSource:
+  '''
+  Draws the pieces from random.Random(seed), or from random when seed is
+  None.
+  '''
+  def __init__(self, seed=None):
+    self.rng = random if seed is None else random.Random(seed)
+
+  def next(self):
+    return self.rng.choice(pieces)
+
+class GameSession:
+  '''
+  One game on a grid_class grid. The pieces come from a PieceSource and the
+  next preview ones are kept in self.queue. step() applies a player action
+  and drop() moves the piece down one row, integrating it and spawning the
+  next one when it lands. game_over is set when a piece can't spawn.
+  recorder, a replay.ReplayRecorder, records every piece before it lands.
+  '''
+  def __init__(self, grid_class=Grid, seed=None, preview=0, recorder=None):
+    self.grid = grid_class(MAP_SIZE[0], MAP_SIZE[1])
+    self.source = PieceSource(seed)
+    self.queue = deque(self.source.next() for _ in range(preview))
+    self.score = 0
+    self.pieces = 0
+    self.game_over = False
+    self.recorder = recorder
+    self.spawn()
+
+  @property
+  def preview(self):
+    return list(self.queue)
+
+  def spawn(self):
+    # drawn before popping so the queue never holds more than preview
+    self.queue.append(self.source.next())
+    new_piece = self.queue.popleft()
+    try:
+      self.grid.add_piece(new_piece.spawn(), SPAWN_X, SPAWN_Y)
+      self.pieces += 1
+    except Collision:
+      self.game_over = True
+
+  def step(self, action):
+    '''
+    Applies action unless it collides, returns whether it was applied.
+    '''
+    grid = self.grid
+    try:
+      if action is Action.LEFT:
+        grid.move_piece(-1, 0)
+      elif action is Action.RIGHT:
+        grid.move_piece(1, 0)
+      elif action is Action.DOWN:
+        grid.move_piece(0, 1)
+      else:
+        grid.rotate_piece()
+    except Collision:
+      if action is Action.LEFT:
+        grid.move_piece(1, 0)
+      elif action is Action.RIGHT:
+        grid.move_piece(-1, 0)
+      elif action is Action.DOWN:
+        grid.move_piece(0, -1)
+      else:
+        grid.rotate_piece_backwards()
+      return False
+
+    return True
+
+  def drop(self):
+    '''
+    Moves the piece down one row. When it can't, the piece lands and the
+    number of rows it cleared is returned, None otherwise.
+    '''
+    grid = self.grid
+    try:
+      grid.move_piece(0, 1)
+      return None
+    except Collision:
+      try:
+        grid.move_piece(0, -1)
+      except Collision:
+        # the piece was placed over blocks
+        self.game_over = True
+        return None
+
+    return self.land()
+
+  def hard_drop(self):
+    '''
+    Drops the piece to where it rests, lands it and returns the number of
+    rows it cleared, None when it was placed over blocks. From the spawn
+    row of a board whose spawn area is clear, the resting row comes from
+    the placement tables.
+    '''
+    grid = self.grid
+    piece = grid.piece
+    x, y = grid.piece_pos
+    if y == SPAWN_Y and is_spawn_area_clear(grid):
+      placement = placements[piece.color][piece.rot]
+      min_x, max_x = placement.min_max_x(grid.w)
+      if min_x <= x <= max_x:
+        grid.piece_pos[1] = placement.landing_y(grid.heights, x, grid.h)
+        return self.land()
+
+    cleared_rows = None
+    while cleared_rows is None and not self.game_over:
+      cleared_rows = self.drop()
+
+    return cleared_rows
+
+  def land(self):
+    if self.recorder:
+      self.recorder.record(self)
+    cleared_rows = self.grid.integrate_piece()
+    self.score += cleared_rows
+    self.spawn()
+    return cleared_rows
@@ -2,5 +2,11 @@ CELL_SIZE = 24
 MAP_SIZE = 12, 22
 FALLING_PER_SECOND = 1
 ACTIONS_PER_SECOND = 12
+# 0 draws as often as the loop can, for benchmarking
 MAX_FPS = 12
-DRAW_TIME = 1000000000 // MAX_FPS
\ No newline at end of file
+DRAW_TIME = 1000000000 // MAX_FPS if MAX_FPS else 0
+# input and gravity are handled this many times a second, drawing MAX_FPS
+SIMULATION_PER_SECOND = 120
+STEP_TIME = 1000000000 // SIMULATION_PER_SECOND
+# most steps run at once to catch up after a stall, the rest are skipped
+MAX_CATCH_UP_STEPS = 5
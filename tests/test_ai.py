@@ -0,0 +1,44 @@
+import pytest
+import ai
+
+# weak weights so the games end quickly
+WEIGHTS = 0.5, 0.1, 0.3, 0.2, 0.1
+
+def test_scores_dont_depend_on_workers(capsys):
+  '''
+  simulate_game prints the sorted score list, it must be the same whether
+  the games are played in this process or spread over a pool.
+  '''
+  ai.simulate_game(8, *WEIGHTS, stop=True, seed=3, workers=1)
+  serial = capsys.readouterr().out
+  ai.simulate_game(8, *WEIGHTS, stop=True, seed=3, workers=2)
+  assert capsys.readouterr().out == serial
+
+def assert_same_moves(ai_class, seeds=range(3)):
+  '''
+  Plays seeded games with AI.run, checking that an ai_class on the same
+  grid picks the same placement at every piece.
+  '''
+  class CheckingBot(ai.VirtualBot):
+    def run(self):
+      ai.VirtualBot.run(self)
+      other = ai_class(self.grid, self.a, self.b, self.c, self.d, self.e)
+      other.run()
+      assert (other.best_fit.rot, other.best_fit.x) == (
+        self.best_fit.rot, self.best_fit.x
+      )
+      assert other.best_fit.fitness == pytest.approx(self.best_fit.fitness)
+
+  for seed in seeds:
+    ai.play_game(seed, *WEIGHTS, stop=True, bot_class=CheckingBot)
+
+def test_batch_ai_matches_ai():
+  pytest.importorskip('numpy')
+  from batch import BatchAI
+
+  assert_same_moves(BatchAI)
+
+def test_beam_search_without_preview_matches_ai():
+  from lookahead import BeamSearchAI
+
+  assert_same_moves(BeamSearchAI)
@@ -0,0 +1,211 @@
+import pytest
+import statistics
+from types import SimpleNamespace
+
+np = pytest.importorskip('numpy')
+
+import brkga
+
+class SerialPool:
+  '''
+  Stands in for multiprocessing.Pool, running the tasks in this process so
+  the games can be mocked.
+  '''
+  def __init__(self, processes=None, initializer=None, initargs=()):
+    if initializer:
+      initializer(*initargs)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    pass
+
+  def map(self, function, iterable):
+    return [function(args) for args in iterable]
+
+def mock_games(monkeypatch, play):
+  '''
+  Plays the games of brkga with play(seed, alleles), which returns the
+  score, in this process. Returns the list of games played.
+  '''
+  games = []
+  def play_session(seed, a, b, c, d, e, stop):
+    games.append((seed, (a, b, c, d, e)))
+    score = play(seed, (a, b, c, d, e))
+    return SimpleNamespace(score=score, pieces=2 * score + 5)
+
+  monkeypatch.setattr(brkga, 'Pool', SerialPool)
+  monkeypatch.setattr(brkga.ai, 'play_session', play_session)
+  return games
+
+def evaluated(seed, log_path, generations):
+  '''
+  Returns a TetrisBRKGA that logged generations with made-up fitnesses,
+  without playing any game.
+  '''
+  run = brkga.TetrisBRKGA(4, seed=seed, log_path=str(log_path))
+  for _ in range(generations):
+    run.fitness = run.rng.random(run.individual_count)
+    run.sort_population()
+    run.save_population()
+    brkga.BRKGA.evolve(run)
+
+  return run
+
+def test_read_log_returns_packed_records(tmp_path):
+  log_path = tmp_path / 'brkga.log'
+  run = brkga.TetrisBRKGA(4, seed=1, log_path=str(log_path))
+  records = []
+  for generation in range(3):
+    run.generation = generation
+    run.fitness = run.rng.random(run.individual_count)
+    run.save_population()
+    records.append((run.population.copy(), run.fitness.copy()))
+    run.population = run.rng.random(run.population.shape)
+
+  log = brkga.read_log(str(log_path))
+  assert list(log['generation']) == [0, 1, 2]
+  for record, (population, fitness) in zip(log, records):
+    assert (record['population'] == population).all()
+    assert (record['fitness'] == fitness).all()
+
+def test_resume_drops_a_truncated_record(tmp_path):
+  log_path = tmp_path / 'brkga.log'
+  run = evaluated(3, log_path, 2)
+  size = log_path.stat().st_size
+  with open(log_path, 'ab') as file:
+    file.write(b'\0' * 100)
+
+  resumed = brkga.TetrisBRKGA(4, seed=3, log_path=str(log_path))
+  assert resumed.resume()
+  assert log_path.stat().st_size == size
+  assert resumed.generation == run.generation
+  assert (resumed.population == run.population).all()
+  assert (resumed.fitness == run.fitness).all()
+
+def test_resume_restores_the_generator_state(tmp_path):
+  log_path = tmp_path / 'brkga.log'
+  run = evaluated(5, log_path, 3)
+
+  # another seed, so only the logged state can give the same numbers
+  resumed = brkga.TetrisBRKGA(4, seed=6, log_path=str(log_path))
+  assert resumed.resume()
+  assert resumed.rng.bit_generator.state == run.rng.bit_generator.state
+  assert (resumed.rng.random(8) == run.rng.random(8)).all()
+
+def test_resume_without_a_generation(tmp_path):
+  log_path = tmp_path / 'brkga.log'
+  run = brkga.TetrisBRKGA(4, seed=1, log_path=str(log_path))
+  assert not run.resume()
+  log_path.write_bytes(b'')
+  assert not run.resume()
+
+def test_fitness_stats_match_statistics():
+  samples = [412.5, 800, 97, 800, 655.5, 3, 800, 241]
+  stats = brkga.FitnessStats()
+  for count, fitness in enumerate(samples, 1):
+    stats.add(fitness)
+    assert stats.count == count
+    assert stats.mean == pytest.approx(statistics.mean(samples[:count]))
+    if count > 1:
+      assert stats.variance == pytest.approx(
+        statistics.variance(samples[:count])
+      )
+    else:
+      assert stats.variance == 0
+
+def game_score(seed, alleles):
+  return round(700 * alleles[0]) + seed % 100
+
+def median_score(run, alleles):
+  seeds = brkga.ai.game_seeds(
+    run.fitness_simulation_count, run.generation_seed()
+  )
+  return brkga.ai.score_stats([game_score(seed, alleles) for seed in seeds])[0]
+
+def test_stored_individuals_are_not_played_again(monkeypatch, tmp_path):
+  games = mock_games(monkeypatch, game_score)
+  run = brkga.TetrisBRKGA(4, seed=2, log_path=str(tmp_path / 'brkga.log'))
+  run.evaluate()
+  assert len(games) == run.games_played == 4 * run.individual_count
+  fitness = run.fitness.copy()
+
+  games.clear()
+  run.generation += 1
+  run.evaluate()
+  assert games == []
+  assert run.games_played == run.pieces_played == 0
+  assert (run.fitness == fitness).all()
+  for alleles in run.population.tolist():
+    assert run.fitness_store.get(alleles, run.seed).count == 1
+
+def test_reevaluation_adds_to_the_running_mean(monkeypatch, tmp_path):
+  games = mock_games(monkeypatch, game_score)
+  run = brkga.TetrisBRKGA(
+    4, reevaluate=True, seed=2, log_path=str(tmp_path / 'brkga.log')
+  )
+  population = run.population.tolist()
+  first = [median_score(run, alleles) for alleles in population]
+  run.evaluate()
+
+  run.generation += 1
+  second = [median_score(run, alleles) for alleles in population]
+  assert first != second
+  games.clear()
+  run.evaluate()
+  assert len(games) == run.games_played == 4 * run.individual_count
+  for alleles, *fitnesses in zip(population, first, second):
+    stats = run.fitness_store.get(alleles, run.seed)
+    assert stats.count == 2
+    assert stats.mean == pytest.approx(statistics.mean(fitnesses))
+    i = run.population.tolist().index(alleles)
+    assert run.fitness[i] == stats.mean
+
+def test_dominated_drops_only_the_clearly_worse():
+  fitness = [10, 8, 8, 6, 4, 3, 9]
+  scores = [
+    [10, 10], [8, 8],
+    # tied with the cutoff
+    [6, 10],
+    # below it, but one game reached it
+    [4, 8],
+    [3, 5], [2, 4],
+    # the best of all, not in contenders
+    [9, 9],
+  ]
+  contenders = [0, 1, 2, 3, 4, 5]
+  assert brkga.dominated(contenders, fitness, scores, 2) == [4, 5]
+  # the cutoff is the keep-th contender's fitness
+  assert brkga.dominated(contenders, fitness, scores, 4) == [4, 5]
+  # the last one's best game reaches the cutoff of 4
+  assert brkga.dominated(contenders, fitness, scores, 5) == []
+  # none of the first keep are dropped, even when below another's games
+  assert brkga.dominated(contenders, fitness, [[20, 20]] * 6, 2) == []
+  assert brkga.dominated(contenders, fitness, scores, 6) == []
+
+def test_racing_finds_the_elite_of_the_full_evaluation(monkeypatch, tmp_path):
+  # the noise of a game is common to all individuals, so the ranking is the
+  # same on any set of games
+  games = mock_games(monkeypatch, game_score)
+  raced = brkga.TetrisBRKGA(
+    16, seed=4, racing=True, log_path=str(tmp_path / 'raced.log')
+  )
+  full = brkga.TetrisBRKGA(16, seed=4, log_path=str(tmp_path / 'full.log'))
+  assert (raced.population == full.population).all()
+
+  raced.race()
+  assert raced.games_played == len(games)
+  assert raced.pieces_played == sum(
+    2 * game_score(seed, alleles) + 5 for seed, alleles in games
+  )
+  games.clear()
+  full.evaluate()
+  assert full.games_played == len(games) == 16 * full.individual_count
+  assert raced.games_played < full.games_played / 2
+
+  elite = full.elite_count
+  assert (
+    sorted(map(tuple, raced.population[:elite].tolist()))
+    == sorted(map(tuple, full.population[:elite].tolist()))
+  )
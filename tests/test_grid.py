@@ -0,0 +1,110 @@
+import random
+import pytest
+from bitgrid import BitGrid
+from colors import Color
+from grid import Grid
+from pieces import pieces
+from placements import placements
+from settings import MAP_SIZE
+
+def baseline_stats(grid):
+  '''
+  The full rescan of the cells that Grid.compute_stats used to do, returns
+  the holes, aggregate height, bumpiness and wells depth.
+  '''
+  heights = [grid.h - 2] + [0 for _ in range(grid.w - 2)] + [grid.h - 2]
+  holes = 0
+  aggregate_height = 0
+  for y in range(1, grid.h - 1):
+    for x in range(1, grid.w - 1):
+      if grid.cells[y][x] != Color.BLACK:
+        if heights[x] == 0:
+          heights[x] = grid.h - 1 - y
+          aggregate_height += heights[x]
+      elif heights[x] != 0:
+        holes += 1
+
+  bumpiness = sum(
+    abs(heights[x] - heights[x - 1]) for x in range(2, grid.w - 1)
+  )
+  wells_depth = 0
+  for x in range(1, grid.w - 1):
+    dh = min(heights[x - 1], heights[x + 1]) - heights[x]
+    if dh >= 3:
+      wells_depth += dh
+
+  return holes, aggregate_height, bumpiness, wells_depth
+
+def resting_positions(grid, piece):
+  '''
+  Returns every (rot, x, y) where piece fits and can't fall further,
+  including the ones under overhangs that a straight drop can't reach.
+  '''
+  positions = []
+  piece = piece.spawn()
+  grid.piece = piece
+  for rot in piece.unique_rotations:
+    piece.rot = rot
+    for x in range(-2, grid.w):
+      for y in range(0, grid.h - 1):
+        grid.piece_pos = [x, y]
+        try:
+          if grid.is_there_collision():
+            continue
+          grid.piece_pos = [x, y + 1]
+          if grid.is_there_collision():
+            positions.append((rot, x, y))
+        except IndexError:
+          continue
+
+  del grid.piece
+  del grid.piece_pos
+  return positions
+
+def random_placements(grid_class, count, seed):
+  '''
+  Yields a board and a random resting placement on it count times, the
+  board starting over when it gets near the top.
+  '''
+  rng = random.Random(seed)
+  grid = grid_class(*MAP_SIZE)
+  for _ in range(count):
+    if max(grid.heights[1:-1]) > grid.h - 8:
+      grid = grid_class(*MAP_SIZE)
+
+    piece = rng.choice(pieces)
+    rot, x, y = rng.choice(resting_positions(grid, piece))
+    yield grid, piece, rot, x, y
+
+def stats(grid):
+  return grid.holes, grid.aggregate_height, grid.bumpiness, grid.wells_depth
+
+@pytest.mark.parametrize('grid_class', [Grid, BitGrid])
+def test_incremental_stats_match_full_rescan(grid_class):
+  tucks = 0
+  for grid, piece, rot, x, y in random_placements(grid_class, 1500, 1):
+    # below where a straight drop would stop, under an overhang
+    tucks += y > placements[piece.color][rot].landing_y(grid.heights, x, grid.h)
+    grid.place(piece, rot, x, y)
+    assert stats(grid) == baseline_stats(grid)
+
+  assert tucks
+
+@pytest.mark.parametrize('grid_class', [Grid, BitGrid])
+def test_undo_restores_cells_stats_and_hash(grid_class):
+  for grid, piece, rot, x, y in random_placements(grid_class, 1500, 2):
+    cells = [row.copy() for row in grid.cells]
+    state = grid.save_state()
+    rows = getattr(grid, 'rows', None)
+    rows = rows and rows.copy()
+
+    _, record = grid.place(piece, rot, x, y)
+    grid.undo(record)
+    assert grid.cells == cells
+    assert grid.save_state() == state
+    assert getattr(grid, 'rows', None) == rows
+    old_hash = grid.hash
+    grid.rehash()
+    assert grid.hash == old_hash
+
+    grid.place(piece, rot, x, y)
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import ai
+import lockstep
+
+# weak weights so the games end quickly
+WEIGHTS = 0.5, 0.1, 0.3, 0.2, 0.1
+
+def test_lockstep_scores_match_simulate_game(capsys):
+  '''
+  Both simulators print the sorted score list, given the same seed every
+  game must score the same.
+  '''
+  ai.simulate_game(12, *WEIGHTS, stop=True, seed=7)
+  serial = capsys.readouterr().out
+  lockstep.simulate_games(12, *WEIGHTS, stop=True, seed=7)
+  assert capsys.readouterr().out == serial
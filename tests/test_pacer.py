@@ -0,0 +1,87 @@
+from pacer import FramePacer
+
+class FakeClock:
+  '''
+  Stands in for gameclock.Clock, and for the time the pacer waits with.
+  Every now() call takes 1 ns, so spinning ends.
+  '''
+  def __init__(self):
+    self.time = 0
+    self.sleeps = []
+
+  def now(self):
+    self.time += 1
+    return self.time - 1
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.time += round(seconds * 1e9)
+
+def make_pacer(clock, max_steps=5):
+  # steps every 10 ns, frames every 100 ns
+  return FramePacer(
+    clock, 10, 100, max_steps, spin_time=2, now=clock.now, sleep=clock.sleep
+  )
+
+def test_one_step_is_due_every_step_time():
+  clock = FakeClock()
+  pacer = make_pacer(clock)
+  assert pacer.steps() == 1
+  pacer.step()
+  assert pacer.sim_clock.time == 10
+
+  clock.time = 5
+  assert pacer.steps() == 0
+  clock.time = 10
+  assert pacer.steps() == 1
+  clock.time = 39
+  assert pacer.steps() == 2
+  assert pacer.skipped_steps == 0
+
+def test_a_stall_runs_at_most_max_steps():
+  clock = FakeClock()
+  pacer = make_pacer(clock, max_steps=3)
+  assert pacer.steps() == 1
+
+  # the steps due at 10, 20, ..., 100
+  clock.time = 105
+  assert pacer.steps() == 3
+  assert pacer.skipped_steps == 7
+  # the late steps are skipped, not run later
+  assert pacer.steps() == 0
+  clock.time = 110
+  assert pacer.steps() == 1
+
+def test_frames_missed_entirely_are_dropped():
+  clock = FakeClock()
+  pacer = make_pacer(clock)
+  assert pacer.draw_due()
+  clock.time = 50
+  assert not pacer.draw_due()
+  clock.time = 100
+  assert pacer.draw_due()
+
+  # the frame due at 200 passed entirely, the one due at 300 is drawn late
+  clock.time = 350
+  assert pacer.draw_due()
+  assert pacer.dropped_frames == 1
+  assert pacer.frames == 3
+  assert list(pacer.intervals) == [100, 250]
+
+  clock.time = 399
+  assert not pacer.draw_due()
+  clock.time = 400
+  assert pacer.draw_due()
+  assert pacer.dropped_frames == 1
+
+def test_wait_sleeps_then_spins_until_the_next_step():
+  clock = FakeClock()
+  pacer = make_pacer(clock)
+  pacer.steps()
+  pacer.draw_due()
+
+  clock.time = 3
+  pacer.wait()
+  # sleeps until spin_time before the step due at 10, then spins to it
+  assert clock.sleeps == [5e-9]
+  assert clock.time == 11
@@ -0,0 +1,39 @@
+from ai import AI, VirtualBot
+from planner import SpeculativePlanner
+from session import GameSession
+
+# weak weights so the game ends quickly, with a high stack at the end
+WEIGHTS = 0.5, 0.1, 0.3, 0.2, 0.1
+
+def test_hits_match_planning_synchronously():
+  session = GameSession(seed=2)
+  bot = VirtualBot(session.grid, *WEIGHTS)
+  bot.run()
+  planner = SpeculativePlanner(bot)
+  planner.speculate()
+  plans = 0
+  try:
+    while True:
+      bot.adjust_position()
+      session.hard_drop()
+      if session.game_over:
+        break
+
+      # every piece planned before the next one is looked up
+      planner.requests.join()
+      hits = planner.hits
+      planner.plan()
+      plans += 1
+      if planner.hits > hits:
+        planned = bot.best_fit
+        synchronous = AI(session.grid, *WEIGHTS)
+        synchronous.run()
+        expected = synchronous.best_fit
+        assert (planned.rot, planned.x, planned.fitness) == (
+          expected.rot, expected.x, expected.fitness
+        )
+  finally:
+    planner.stop()
+
+  assert planner.hits > 0
+  assert planner.hits + planner.misses == plans
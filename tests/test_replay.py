@@ -0,0 +1,73 @@
+import pytest
+import ai
+import replay
+from bitgrid import BitGrid
+from grid import Grid
+from pieces import pieces
+from placements import placements
+from replay import (
+  ReplayError, ReplayReader, ReplayRecorder, pack_placement, unpack_placement
+)
+from session import GameSession
+
+# weak weights so the game ends quickly, after 849 pieces with seed 1
+WEIGHTS = 0.5, 0.1, 0.3, 0.2, 0.1
+
+def test_every_placement_round_trips_on_the_largest_boards():
+  for width, height in ((15, 22), (12, 34)):
+    assert replay.fits(width, height)
+    for color, rotations in placements.items():
+      for rot, shape in enumerate(rotations):
+        min_x, max_x = shape.min_max_x(width)
+        for x in range(min_x, max_x + 1):
+          for y in range(1 - shape.top, height - 1 - shape.bottom):
+            value = pack_placement(6, rot, x, y)
+            assert value < 1 << 16
+            assert unpack_placement(value) == (6, rot, x, y)
+
+def test_boards_whose_placements_overflow_are_refused(tmp_path):
+  assert not replay.fits(16, 22)
+  assert not replay.fits(12, 35)
+
+  recorder = ReplayRecorder(str(tmp_path / 'wide.replay'))
+  session = GameSession(lambda width, height: Grid(16, height), seed=1)
+  with pytest.raises(ReplayError):
+    recorder.record(session)
+
+def test_seeds_out_of_64_bits_are_refused_before_the_game(tmp_path):
+  path = tmp_path / 'game.replay'
+  for seed in (-1, 1 << 64):
+    with pytest.raises(ReplayError):
+      ai.play_game(seed, *WEIGHTS, record_path=str(path))
+    assert not path.exists()
+
+def test_seek_matches_an_incremental_replay(tmp_path):
+  path = str(tmp_path / 'game.replay')
+  ai.play_game(1, *WEIGHTS, stop=True, record_path=path)
+  with ReplayReader(path) as reader:
+    count = reader.piece_count
+    assert count > 3 * reader.interval
+    every = list(reader.placements())
+    assert len(every) == count
+
+    for start in (0, 1, 255, 256, 257, count - 1, count):
+      assert list(reader.placements(start)) == every[start:]
+
+    points = {
+      0, 1, 255, 256, 257, 512, 2 * reader.interval + 100, count - 1, count
+    }
+    for grid_class in (Grid, BitGrid):
+      grid = grid_class(reader.width, reader.height)
+      score = 0
+      for n in range(count + 1):
+        if n in points:
+          seeked, seeked_score = reader.seek(n, grid_class)
+          assert seeked_score == score
+          assert list(seeked.row_masks()) == list(grid.row_masks())
+          assert seeked.hash == grid.hash
+        if n < count:
+          piece_index, rot, x, y = every[n]
+          score += grid.place(pieces[piece_index], rot, x, y)[0]
+
+      assert score == reader.score
+      assert grid.hash == reader.hash
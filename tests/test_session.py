@@ -0,0 +1,22 @@
+import random
+from pieces import pieces
+from session import GameSession
+
+def test_preview_holds_preview_pieces():
+  for preview in range(4):
+    session = GameSession(seed=1, preview=preview)
+    assert len(session.preview) == preview
+    while not session.game_over:
+      session.hard_drop()
+      assert len(session.preview) == preview
+
+def test_pieces_come_in_seed_order():
+  for preview in range(3):
+    session = GameSession(seed=7, preview=preview)
+    rng = random.Random(7)
+    expected = [rng.choice(pieces) for _ in range(preview + 1)]
+    while not session.game_over:
+      assert session.grid.piece.color is expected[0].color
+      assert session.preview == expected[1:]
+      session.hard_drop()
+      expected = expected[1:] + [rng.choice(pieces)]
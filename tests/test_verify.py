@@ -0,0 +1,49 @@
+import struct
+import pytest
+import ai
+import replay
+import verify
+from verify import verify_replay, verify_worker
+
+# offset of the first placement of the first block
+FIRST_PLACEMENT = (
+  replay.HEADER.size + replay.KEYFRAME_HEAD.size
+  + replay.keyframe_struct(22).size
+)
+
+@pytest.fixture
+def recorded(tmp_path):
+  path = str(tmp_path / 'game.replay')
+  ai.play_game(3, stop=True, record_path=path)
+  return path
+
+def corrupt(path, shift, mask, value):
+  with open(path, 'r+b') as file:
+    file.seek(FIRST_PLACEMENT)
+    placement, = struct.unpack('<H', file.read(2))
+    file.seek(FIRST_PLACEMENT)
+    file.write(struct.pack('<H', placement & ~(mask << shift) | value << shift))
+
+def test_recorded_game_verifies(recorded):
+  result = verify_replay(recorded)
+  assert result['ok'], result['error']
+
+@pytest.mark.parametrize('shift, mask, value', [
+  (0, 7, 7),     # piece index past the last piece
+  (5, 15, 15),   # x past the right wall
+  (9, 31, 31),   # y past the bottom wall
+])
+def test_out_of_range_fields_fail_the_replay(recorded, shift, mask, value):
+  corrupt(recorded, shift, mask, value)
+  result = verify_replay(recorded)
+  assert not result['ok']
+  assert result['error'].startswith('piece 0 ')
+
+def test_worker_reports_unexpected_errors(monkeypatch):
+  def fail(path, grid_class):
+    raise RuntimeError('engine bug')
+
+  monkeypatch.setattr(verify, 'verify_replay', fail)
+  result = verify_worker('game.replay')
+  assert not result['ok']
+  assert result['error'] == 'RuntimeError: engine bug'
@@ -0,0 +1,121 @@
+import ctypes
+from collections import OrderedDict
+from sdl2.sdlttf import TTF_RenderText_Blended, TTF_SizeText
+from sdl2 import (
+  SDL_BlitSurface, SDL_Color, SDL_FreeSurface, SDL_Rect,
+  SDL_CreateTextureFromSurface, SDL_DestroyTexture, SDL_RenderCopy
+)
+
+def text_size(font, text):
+  w = ctypes.c_int()
+  h = ctypes.c_int()
+  TTF_SizeText(font, text.encode(), ctypes.byref(w), ctypes.byref(h))
+  return w.value, h.value
+
+class GlyphStrip:
+  '''
+  Renders chars once, side by side in one surface, plus a texture when a
+  renderer is given. Text made of those characters is then drawn glyph by
+  glyph from the strip without rendering it again, kerning between the
+  glyphs being ignored.
+  '''
+  def __init__(self, font, chars, color, renderer=None):
+    self.renderer = renderer
+    self.surface = TTF_RenderText_Blended(font, chars.encode(), color)
+    self.height = self.surface.contents.h
+    offsets = [text_size(font, chars[:i])[0] for i in range(len(chars) + 1)]
+    self.glyphs = {
+      char: SDL_Rect(offsets[i], 0, offsets[i + 1] - offsets[i], self.height)
+      for i, char in enumerate(chars)
+    }
+    self.texture = None
+    if renderer:
+      self.texture = SDL_CreateTextureFromSurface(renderer, self.surface)
+
+  def free(self):
+    SDL_FreeSurface(self.surface)
+    if self.texture:
+      SDL_DestroyTexture(self.texture)
+
+  def width(self, text):
+    return sum(self.glyphs[char].w for char in text)
+
+  def draw(self, text, x, y, dest_surface=None):
+    '''
+    Draws text with its top left corner at (x, y), through the renderer or
+    on dest_surface.
+    '''
+    for char in text:
+      src_rect = self.glyphs[char]
+      dest_rect = SDL_Rect(x, y, src_rect.w, self.height)
+      if self.renderer:
+        SDL_RenderCopy(
+          self.renderer, self.texture, ctypes.byref(src_rect),
+          ctypes.byref(dest_rect)
+        )
+      else:
+        SDL_BlitSurface(
+          self.surface, ctypes.byref(src_rect), dest_surface,
+          ctypes.byref(dest_rect)
+        )
+
+      x += src_rect.w
+
+class TextCache:
+  '''
+  Bounded LRU cache of rendered text for HUD elements, keyed by the text
+  and its (r, g, b) color. Evicted surfaces and textures are freed.
+  '''
+  def __init__(self, font, renderer=None, max_size=64):
+    self.font = font
+    self.renderer = renderer
+    self.max_size = max_size
+    self.entries = OrderedDict()
+
+  def get(self, text, color=(255, 255, 255)):
+    '''
+    Returns the surface and texture, None without a renderer, of text.
+    '''
+    key = text, color
+    entry = self.entries.get(key)
+    if entry is None:
+      surface = TTF_RenderText_Blended(
+        self.font, text.encode(), SDL_Color(*color)
+      )
+      texture = None
+      if self.renderer:
+        texture = SDL_CreateTextureFromSurface(self.renderer, surface)
+      entry = self.entries[key] = surface, texture
+      if len(self.entries) > self.max_size:
+        self.free_entry(self.entries.popitem(last=False)[1])
+    else:
+      self.entries.move_to_end(key)
+
+    return entry
+
+  def draw(self, text, x, y, color=(255, 255, 255), dest_surface=None):
+    '''
+    Draws text with its top left corner at (x, y), through the renderer or
+    on dest_surface, and returns the SDL_Rect it covers.
+    '''
+    surface, texture = self.get(text, color)
+    dest_rect = SDL_Rect(x, y, surface.contents.w, surface.contents.h)
+    if texture:
+      SDL_RenderCopy(self.renderer, texture, None, ctypes.byref(dest_rect))
+    else:
+      SDL_BlitSurface(
+        surface, None, dest_surface, ctypes.byref(SDL_Rect(x, y))
+      )
+
+    return dest_rect
+
+  def free_entry(self, entry):
+    surface, texture = entry
+    SDL_FreeSurface(surface)
+    if texture:
+      SDL_DestroyTexture(texture)
+
+  def free(self):
+    for entry in self.entries.values():
+      self.free_entry(entry)
+    self.entries.clear()
@@ -0,0 +1,198 @@
+'''
+Verifies recorded games by replaying their placements on a fresh board,
+without running the AI, and checking the pieces, keyframes, final score
+and board hash against the recording. Results are written as JSON lines.
+'''
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from multiprocessing import Pool
+from grid import Grid
+from bitgrid import BitGrid
+from pieces import pieces
+from placements import placements
+from replay import ReplayReader, ReplayError, unpack_placement
+from session import PieceSource
+
+ENGINES = {'bitgrid': BitGrid, 'grid': Grid}
+
+class VerificationError(Exception):
+  pass
+
+def rotated_copy(piece, rot):
+  piece = piece.spawn()
+  piece.rot = rot
+  return piece
+
+# rotated[piece index][rot] is the piece at that rotation, for the
+# collision checks
+rotated = [[rotated_copy(piece, rot) for rot in range(4)] for piece in pieces]
+
+def check_placement(grid, piece_index, rot, x, y):
+  '''
+  Raises VerificationError when the piece index doesn't exist, or the
+  piece lies outside the board, overlaps it at (x, y) or could still fall.
+  '''
+  if piece_index >= len(pieces):
+    raise VerificationError('has no piece {}'.format(piece_index))
+
+  placement = placements[pieces[piece_index].color][rot]
+  if (
+    x + placement.left < 0 or x + placement.right >= grid.w
+    or y + placement.top < 0 or y + placement.bottom >= grid.h
+  ):
+    raise VerificationError('lies outside the board')
+
+  grid.piece = rotated[piece_index][rot]
+  grid.piece_pos = [x, y]
+  if grid.is_there_collision():
+    raise VerificationError('overlaps the board')
+
+  grid.piece_pos[1] += 1
+  if not grid.is_there_collision():
+    raise VerificationError('doesn\'t rest on anything')
+
+def verify_replay(path, grid_class=BitGrid):
+  '''
+  Replays the game recorded at path on a grid_class board and returns a
+  result dict, 'ok' being whether everything matched the recording.
+  '''
+  result = {'path': path, 'ok': False, 'error': None}
+  try:
+    replay = ReplayReader(path)
+  except (OSError, ReplayError) as error:
+    result['error'] = str(error)
+    return result
+
+  with replay:
+    result.update(
+      expected_pieces=replay.piece_count, expected_score=replay.score,
+      expected_hash=replay.hash
+    )
+    grid = grid_class(replay.width, replay.height)
+    source = None if replay.seed is None else PieceSource(replay.seed)
+    score = 0
+    count = 0
+    try:
+      for block in range(replay.block_count()):
+        keyframe_score, _, masks, placements = replay.read_block(block)
+        if keyframe_score != score or list(masks) != list(grid.row_masks()):
+          raise VerificationError('keyframe {} differs'.format(block))
+
+        for value in placements:
+          piece_index, rot, x, y = unpack_placement(value)
+          try:
+            check_placement(grid, piece_index, rot, x, y)
+          except VerificationError as error:
+            raise VerificationError('piece {} {}'.format(count, error))
+
+          piece = pieces[piece_index]
+          if source and source.next() is not piece:
+            raise VerificationError(
+              'piece {} isn\'t from the seed'.format(count)
+            )
+
+          score += grid.place(piece, rot, x, y, False)[0]
+          count += 1
+
+      if count != replay.piece_count:
+        raise VerificationError('piece count differs')
+      if score != replay.score:
+        raise VerificationError('score differs')
+      if grid.hash != replay.hash:
+        raise VerificationError('board hash differs')
+      result['ok'] = True
+    except (VerificationError, ReplayError, struct.error) as error:
+      result['error'] = str(error)
+
+    result.update(pieces=count, score=score, hash=grid.hash)
+
+  return result
+
+# grid class of each verify_worker process
+worker_grid_class = BitGrid
+
+def init_worker(grid_class):
+  global worker_grid_class
+  worker_grid_class = grid_class
+
+def verify_worker(path):
+  '''
+  Reports any error a replay raises in its result, so one bad file doesn't
+  end the whole run.
+  '''
+  try:
+    return verify_replay(path, worker_grid_class)
+  except Exception as error:
+    return {
+      'path': path, 'ok': False,
+      'error': '{}: {}'.format(type(error).__name__, error)
+    }
+
+def replay_paths(paths):
+  '''
+  Returns paths with every directory replaced by the .replay files in it.
+  '''
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files.extend(sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.endswith('.replay')
+      ))
+    else:
+      files.append(path)
+
+  return files
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Replays recorded games and checks them, one JSON line per '
+    'replay.'
+  )
+  parser.add_argument(
+    'paths', nargs='+', help='replay files or directories of .replay files'
+  )
+  parser.add_argument(
+    '--workers', type=int, default=os.cpu_count(),
+    help='processes verifying the replays'
+  )
+  parser.add_argument(
+    '--engine', choices=sorted(ENGINES), default='bitgrid',
+    help='board the games are replayed on'
+  )
+  parser.add_argument('--output', help='write the results there, not stdout')
+  args = parser.parse_args()
+
+  paths = replay_paths(args.paths)
+  grid_class = ENGINES[args.engine]
+  output = open(args.output, 'w') if args.output else sys.stdout
+  failures = 0
+  placements = 0
+  t0 = time.perf_counter()
+  with Pool(args.workers, init_worker, (grid_class,)) as pool:
+    for result in pool.imap_unordered(verify_worker, paths):
+      failures += not result['ok']
+      placements += result.get('pieces', 0)
+      output.write(json.dumps(result) + '\n')
+      output.flush()
+
+  if args.output:
+    output.close()
+
+  elapsed = time.perf_counter() - t0
+  print(
+    '{} replays, {} failed, {} placements in {:.2f} s, {:.0f} placements/s'
+    .format(
+      len(paths), failures, placements, elapsed, placements / elapsed
+    ),
+    file=sys.stderr
+  )
+  return 1 if failures else 0
+
+if __name__ == '__main__':
+  sys.exit(main())